@@ -0,0 +1,163 @@
+import os
+import glob
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from video_merger import merge_videos, setup_logging, COLOR_SCHEMES, MERGE_BACKENDS
+from ffmpeg_utils import SCALE_MODES
+from job_manager import JobManager, STATUS_NAMES
+
+# 同时进行的合并任务数；转码进程由所有任务共享
+DEFAULT_JOBS = 2
+# 输出文件名，{name} 为输入目录名，相对路径保存在输入目录中
+DEFAULT_OUTPUT = '{name}-final.mp4'
+REPORT_NAME = 'batch_report.json'
+# 任务清单中每个任务可以单独设置的合并参数
+JOB_OPTIONS = ('title', 'author', 'color_scheme', 'backend', 'scale_mode', 'fast_path', 'use_cache', 'incremental',
+               'streaming', 'max_readers', 'max_memory', 'chunk_size', 'videos', 'renditions', 'dedup')
+
+
+def expand_inputs(patterns):
+    """展开输入目录中的通配符（如 downloads/11-*），返回去重后的目录列表，保持顺序"""
+    directories = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"没有匹配的目录: {pattern}")
+        directories.extend(os.path.abspath(path) for path in matches if os.path.isdir(path))
+    return list(dict.fromkeys(directories))
+
+
+def load_manifest(path):
+    """读取任务清单：JSON列表，每项为输入目录，或 {'input_dir': 目录, 'output': 输出文件, 其他合并参数}
+
+    清单中的相对目录相对于清单文件所在目录。
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        entries = json.load(file)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'input_dir': entry}
+        unknown = set(entry) - set(JOB_OPTIONS) - {'input_dir', 'output'}
+        if unknown:
+            raise ValueError(f"任务清单中有未知的参数: {', '.join(sorted(unknown))}")
+        entry = dict(entry, input_dir=os.path.join(base_dir, entry['input_dir']))
+        jobs.append(entry)
+    return jobs
+
+
+def output_for(input_dir, output=None, pattern=DEFAULT_OUTPUT):
+    """计算任务的输出路径：相对路径保存在输入目录中"""
+    name = os.path.basename(os.path.normpath(input_dir))
+    return os.path.abspath(os.path.join(input_dir, (output or pattern).format(name=name)))
+
+
+def run_job(spec, defaults, pool, workers, progress=None):
+    """执行一个合并任务（在任务线程中运行），返回任务报告"""
+    options = dict(defaults, **{key: value for key, value in spec.items() if key in JOB_OPTIONS})
+    started = time.time()
+    result = merge_videos(spec['input_dir'], spec['output'], pool=pool, workers=workers, progress=progress, **options)
+    if result is False or not os.path.exists(spec['output']):
+        raise RuntimeError("合并失败，没有生成输出文件（详见日志）")
+    return {'seconds': round(time.time() - started, 1), 'size': os.path.getsize(spec['output'])}
+
+
+def run_batch(specs, defaults=None, jobs=DEFAULT_JOBS, workers=None, skip_existing=False):
+    """在一个进程中执行多个合并任务，所有任务共享转码进程池、过渡画面缓存和探测索引，返回每个任务的报告"""
+    defaults = defaults or {}
+    workers = max(1, workers or os.cpu_count() or 1)
+    reports = []
+    submitted = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        manager = JobManager(max_workers=jobs, limits={'merge': jobs})
+        try:
+            for spec in specs:
+                report = {'input_dir': spec['input_dir'], 'output': spec['output']}
+                reports.append(report)
+                if skip_existing and os.path.exists(spec['output']):
+                    report.update(status='skipped')
+                    continue
+                # 同一个输出文件的任务依次执行
+                job = manager.submit('merge', run_job, spec, defaults, pool, workers, resource=spec['output'])
+                submitted.append((report, job))
+
+            for done, (report, job) in enumerate(submitted, 1):
+                for _ in job.watch(interval=5.0):
+                    pass
+                report['status'] = job.status
+                if job.status == 'done':
+                    report.update(job.result)
+                else:
+                    report['error'] = job.error
+                print(f"[{done}/{len(submitted)}] {STATUS_NAMES[job.status]}: {report['output']}")
+        except KeyboardInterrupt:
+            print("\n正在取消剩余的任务...")
+            for _, job in submitted:
+                manager.cancel(job.id)
+            for report, job in submitted:
+                for _ in job.watch(interval=5.0):
+                    pass
+                report['status'] = job.status
+    return reports
+
+
+def write_report(reports, path=REPORT_NAME):
+    """打印并保存每个任务的结果"""
+    print("\n=== 批量合并结果 ===")
+    for report in reports:
+        line = f"{STATUS_NAMES.get(report['status'], '已跳过'):<4} {report['input_dir']}"
+        if report['status'] == 'done':
+            line += f"  ->  {report['output']}（{report['seconds']} 秒，{report['size'] / 1024 / 1024:.1f}MB）"
+        elif report.get('error'):
+            line += f"  错误: {report['error']}"
+        print(line)
+    counts = {}
+    for report in reports:
+        counts[report['status']] = counts.get(report['status'], 0) + 1
+    print(f"成功 {counts.get('done', 0)} 个，失败 {counts.get('failed', 0)} 个，跳过 {counts.get('skipped', 0)} 个")
+    try:
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(reports, file, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"写入合并报告失败: {str(e)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='批量合并多个目录的视频（共享转码进程和缓存）')
+    parser.add_argument('inputs', nargs='*', help='输入目录，支持通配符（如 "downloads/11-*"）')
+    parser.add_argument('-m', '--manifest', help='任务清单（JSON），每项为目录或包含 input_dir、output 和合并参数的对象')
+    parser.add_argument('-o', '--output', default=DEFAULT_OUTPUT,
+                        help='输出文件名，{name} 为输入目录名，相对路径保存在输入目录中')
+    parser.add_argument('-t', '--title', type=str, default="今日份快乐", help='视频标题')
+    parser.add_argument('-a', '--author', type=str, default="Cynvann", help='作者名称')
+    parser.add_argument('-c', '--color_scheme', choices=list(COLOR_SCHEMES), default='p6', help='颜色方案')
+    parser.add_argument('-b', '--backend', choices=list(MERGE_BACKENDS), default='auto', help='渲染方式')
+    parser.add_argument('-s', '--scale_mode', choices=list(SCALE_MODES), default='stretch', help='缩放方式')
+    parser.add_argument('--renditions', nargs='+', default=None, help='每个任务同时生成的其他输出版本（如 480p preview）')
+    parser.add_argument('--dedup', action='store_true', help='跳过每个目录中内容重复的视频')
+    parser.add_argument('-j', '--jobs', type=int, default=DEFAULT_JOBS, help='同时进行的合并任务数')
+    parser.add_argument('-w', '--workers', type=int, default=None, help='所有任务共享的转码进程数（默认CPU核数）')
+    parser.add_argument('--skip_existing', action='store_true', help='跳过输出文件已存在的目录')
+    parser.add_argument('--report', default=REPORT_NAME, help='任务报告保存位置')
+    args = parser.parse_args()
+    setup_logging()
+
+    specs = [{'input_dir': directory} for directory in expand_inputs(args.inputs)]
+    if args.manifest:
+        specs += load_manifest(args.manifest)
+    if not specs:
+        parser.error("没有要合并的目录，请指定输入目录或任务清单")
+    for spec in specs:
+        spec['output'] = output_for(spec['input_dir'], spec.get('output'), args.output)
+
+    defaults = {'title': args.title, 'author': args.author, 'color_scheme': args.color_scheme,
+                'backend': args.backend, 'scale_mode': args.scale_mode, 'renditions': args.renditions, 'dedup': args.dedup}
+    print(f"共 {len(specs)} 个合并任务，同时进行 {args.jobs} 个")
+    logging.info(f"批量合并: {len(specs)} 个任务")
+    reports = run_batch(specs, defaults, jobs=max(1, args.jobs), workers=args.workers,
+                        skip_existing=args.skip_existing)
+    write_report(reports, args.report)
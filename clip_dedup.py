@@ -0,0 +1,158 @@
+import os
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from ffmpeg_utils import run_ffmpeg
+from probe_index import get_index
+
+# 每个视频均匀截取的帧数，以及差异哈希（dHash）的尺寸：缩小为 (宽+1)x高 的灰度图，每行比较相邻像素得到 宽x高 位
+SAMPLE_COUNT = 4
+HASH_SIZE = 8
+# 平均每帧不同的位数不超过这个值时视为重复（每帧共 HASH_SIZE*HASH_SIZE 位）
+DEFAULT_THRESHOLD = 8
+# 时长相差超过这个值（秒）的视频不比较
+DURATION_TOLERANCE = 0.5
+# 同时运行的ffmpeg进程数
+DEDUP_WORKERS = 4
+
+# 已计算的帧哈希，按 路径 + 大小 + 修改时间 缓存，刷新列表时不重复截帧
+_hashes = {}
+
+
+def sample_frames(path, duration, count=SAMPLE_COUNT):
+    """用一次ffmpeg调用在视频中均匀截取 count 帧，缩小为 (HASH_SIZE+1)xHASH_SIZE 的灰度图，返回原始像素数据"""
+    args = []
+    for n in range(count):
+        # 每个输入只读取截取点之后的一小段，不解码到文件末尾
+        args += ['-ss', f"{duration * (n + 0.5) / count:.3f}", '-t', '1', '-i', path]
+    filters = [f"[{n}:v:0]trim=end_frame=1,scale={HASH_SIZE + 1}:{HASH_SIZE}:flags=area,format=gray[f{n}]"
+               for n in range(count)]
+    filters.append(''.join(f"[f{n}]" for n in range(count)) + f"concat=n={count}:v=1:a=0[out]")
+    # rawvideo默认按帧率补帧或丢帧，拼接的帧时间戳不连续，需要原样输出
+    args += ['-filter_complex', ';'.join(filters), '-map', '[out]', '-fps_mode', 'passthrough',
+             '-frames:v', str(count), '-f', 'rawvideo', 'pipe:1']
+    data = run_ffmpeg(args, f"截取 {os.path.basename(path)} 的画面").stdout
+    frame_size = (HASH_SIZE + 1) * HASH_SIZE
+    if len(data) != count * frame_size:
+        raise RuntimeError(f"截取 {os.path.basename(path)} 的画面失败: 只得到 {len(data) // frame_size} 帧")
+    return data
+
+
+def hash_frames(samples, count=SAMPLE_COUNT):
+    """批量计算差异哈希：samples 为每个视频的原始像素数据，返回 (视频数, count) 的 uint64 数组"""
+    import numpy as np
+
+    pixels = np.frombuffer(b''.join(samples), dtype=np.uint8).reshape(len(samples), count, HASH_SIZE, HASH_SIZE + 1)
+    bits = pixels[..., 1:] > pixels[..., :-1]
+    return np.packbits(bits.reshape(len(samples), count, -1), axis=-1).view('>u8')[..., 0].astype(np.uint64)
+
+
+def _file_key(path):
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    return path, stat.st_size, stat.st_mtime
+
+
+def clip_hashes(paths, durations):
+    """获取多个视频的帧哈希，返回 (uint64数组, 有效的视频下标)；无法截帧的视频不参与比较"""
+    import numpy as np
+
+    keys, missing = {}, []
+    for i, (path, duration) in enumerate(zip(paths, durations)):
+        if not duration:
+            continue
+        try:
+            keys[i] = _file_key(path)
+        except OSError:
+            continue
+        if keys[i] not in _hashes:
+            missing.append(i)
+
+    if missing:
+        with ThreadPoolExecutor(max_workers=DEDUP_WORKERS) as pool:
+            futures = {i: pool.submit(sample_frames, paths[i], durations[i]) for i in missing}
+        samples = {}
+        for i, future in futures.items():
+            try:
+                samples[i] = future.result()
+            except RuntimeError as e:
+                logging.warning(f"跳过无法截帧的视频: {str(e)}")
+                del keys[i]
+        if samples:
+            for i, hashes in zip(samples, hash_frames(list(samples.values()))):
+                _hashes[keys[i]] = hashes
+
+    indices = sorted(keys)
+    if not indices:
+        return np.zeros((0, SAMPLE_COUNT), dtype=np.uint64), []
+    return np.stack([_hashes[keys[i]] for i in indices]), indices
+
+
+def hamming_distances(hashes):
+    """两两之间的平均汉明距离（每帧不同的位数），hashes 为 (视频数, 帧数) 的 uint64 数组"""
+    import numpy as np
+
+    popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+    xor = hashes[:, None, :] ^ hashes[None, :, :]
+    return popcount[xor.view(np.uint8)].reshape(len(hashes), len(hashes), -1).sum(axis=-1) / hashes.shape[1]
+
+
+def find_duplicates(paths, durations, threshold=DEFAULT_THRESHOLD, duration_tolerance=DURATION_TOLERANCE):
+    """找出内容重复的视频，返回分组 [[保留的下标, 重复的下标, ...]]，每组保留最先出现的视频
+
+    每个视频截取几帧计算差异哈希，时长相近且平均汉明距离不超过 threshold 的视频归为一组。
+    """
+    import numpy as np
+
+    hashes, indices = clip_hashes(paths, durations)
+    if len(indices) < 2:
+        return []
+    lengths = np.array([durations[i] for i in indices], dtype=float)
+    close = (hamming_distances(hashes) <= threshold) & \
+            (np.abs(lengths[:, None] - lengths[None, :]) <= duration_tolerance)
+
+    # 并查集合并相似的视频，每组以最小下标为根
+    parent = list(range(len(indices)))
+
+    def find(n):
+        while parent[n] != n:
+            parent[n] = parent[parent[n]]
+            n = parent[n]
+        return n
+
+    for a, b in zip(*np.nonzero(np.triu(close, k=1))):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    groups = {}
+    for n in range(len(indices)):
+        groups.setdefault(find(n), []).append(indices[n])
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def drop_duplicates(paths, durations, threshold=DEFAULT_THRESHOLD):
+    """去掉重复的视频，返回 (保留的下标列表, 分组)"""
+    groups = find_duplicates(paths, durations, threshold)
+    dropped = {i for group in groups for i in group[1:]}
+    return [i for i in range(len(paths)) if i not in dropped], groups
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='查找文件夹中内容重复的视频（同一个视频以不同文件名下载了多次）')
+    parser.add_argument('input_dir', help='视频文件夹')
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f'平均每帧不同的位数不超过这个值时视为重复（共 {HASH_SIZE * HASH_SIZE} 位）')
+    args = parser.parse_args()
+
+    index = get_index(args.input_dir)
+    video_files = sorted(index.list_videos())
+    infos = index.probe_many(video_files)
+    groups = find_duplicates(video_files, [info['duration'] if info else None for info in infos], args.threshold)
+    if not groups:
+        print(f"{len(video_files)} 个视频中没有重复的视频")
+    for group in groups:
+        print(f"\n保留: {os.path.basename(video_files[group[0]])}")
+        for i in group[1:]:
+            print(f"  重复: {os.path.basename(video_files[i])}")
+    if groups:
+        print(f"\n共 {sum(len(group) - 1 for group in groups)} 个重复视频")
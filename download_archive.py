@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from urllib.parse import urlsplit
+from segment_cache import file_sha256
+from instagram_links import canonicalize_link
+
+ARCHIVE_NAME = '.download_archive.json'
+ARCHIVE_VERSION = 1
+
+
+def archive_key(link):
+    """下载记录的key：Instagram链接使用短代码（同一帖子的 /p/ 和 /reel/ 链接相同），分享链接和其他链接使用去掉查询参数的地址"""
+    parts = urlsplit(link.strip())
+    if parts.netloc.lower() in ('instagram.com', 'www.instagram.com'):
+        kind, shortcode = canonicalize_link(link.strip())
+        if kind not in ('link', 'share'):
+            return f'instagram:{shortcode}'
+    return f'url:{parts.netloc.lower()}{parts.path.rstrip("/")}'
+
+
+class DownloadArchive:
+    """输出目录中的下载记录：按链接key和文件内容哈希记录已下载的视频
+
+    重新运行同一批链接时，记录中存在且文件仍在的链接直接跳过，不发出任何网络请求；
+    内容与已有文件相同的新下载会被删除，只保留一份。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = os.path.abspath(output_dir)
+        self.path = os.path.join(self.output_dir, ARCHIVE_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == ARCHIVE_VERSION:
+                data.setdefault('items', {})
+                return data
+        except (OSError, ValueError):
+            pass
+        return {'version': ARCHIVE_VERSION, 'items': {}}
+
+    def _file_valid(self, entry):
+        path = os.path.join(self.output_dir, entry['file'])
+        try:
+            return os.path.getsize(path) == entry['size']
+        except OSError:
+            return False
+
+    def lookup(self, link):
+        """返回链接已下载的文件列表，没有记录或文件已丢失时返回None"""
+        with self._lock:
+            item = self.data['items'].get(archive_key(link))
+        if not item or not item['files'] or not all(self._file_valid(entry) for entry in item['files']):
+            return None
+        return [os.path.join(self.output_dir, entry['file']) for entry in item['files']]
+
+    def _find_hash(self, sha256):
+        for item in self.data['items'].values():
+            for entry in item['files']:
+                if entry['sha256'] == sha256 and self._file_valid(entry):
+                    return entry
+        return None
+
+    def record(self, link, paths):
+        """记录链接下载的文件；内容与已有文件重复时删除新文件，改为引用已有文件。返回最终的文件列表"""
+        entries = []
+        for path in paths:
+            sha256 = file_sha256(path)
+            with self._lock:
+                existing = self._find_hash(sha256)
+            name = os.path.relpath(os.path.abspath(path), self.output_dir)
+            if existing is not None and existing['file'] != name:
+                os.remove(path)
+                print(f"内容与已下载的 {existing['file']} 相同，删除重复文件 {name}")
+                entries.append(dict(existing))
+            else:
+                entries.append({'file': name, 'sha256': sha256, 'size': os.path.getsize(path)})
+        with self._lock:
+            self.data['items'][archive_key(link)] = {
+                'link': link,
+                'files': entries,
+                'downloaded': time.time(),
+            }
+        self.save()
+        return [os.path.join(self.output_dir, entry['file']) for entry in entries]
+
+    def save(self):
+        """原子写入下载记录"""
+        with self._lock:
+            content = json.dumps(self.data, ensure_ascii=False, indent=2)
+            try:
+                fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.output_dir)
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    file.write(content)
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                print(f"保存下载记录失败: {str(e)}")
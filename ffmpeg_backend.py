@@ -0,0 +1,130 @@
+import os
+import logging
+import tempfile
+from ffmpeg_utils import run_ffmpeg, scale_filter
+from renditions import fan_out_filters, encoder_args
+
+# 输出参数，与moviepy路径的 write_videofile 设置保持一致
+DEFAULT_OUTPUT = {
+    'size': (720, 1280),
+    'fps': 30,
+    'preset': 'medium',
+    'bitrate': '4000k',
+    'audio_bitrate': '192k',
+    'sample_rate': 44100,
+}
+
+
+def _video_chain(label, size, fps, scale_mode='stretch', tag=''):
+    """统一分辨率、像素宽高比、帧率和像素格式"""
+    return f"{label}{scale_filter(size, scale_mode, tag)},fps={fps},format=yuv420p"
+
+
+def _audio_format(sample_rate):
+    return f"aresample={sample_rate},aformat=sample_fmts=fltp:channel_layouts=stereo"
+
+
+def build_filter_graph(timeline, chime_index=None, output=None, scale_mode='stretch'):
+    """把时间线编译为 filter_complex 图
+
+    timeline 中每一项为 {'type': 'image' 或 'video', 'input': 输入序号, 'duration': 秒, 'has_audio': bool}。
+    图片项（过渡画面）使用 chime_index 指向的音效，没有音效时使用静音。
+    视频项按 scale_mode 缩放（拉伸 / 加黑边 / 模糊背景），过渡画面本身已是目标尺寸。
+    返回 (图字符串, 视频输出标签, 音频输出标签)
+    """
+    output = output or DEFAULT_OUTPUT
+    fps = output['fps']
+    sample_rate = output['sample_rate']
+    audio_format = _audio_format(sample_rate)
+
+    filters = []
+    image_count = sum(1 for item in timeline if item['type'] == 'image')
+    chime_labels = []
+    if chime_index is not None and image_count:
+        chime_labels = [f"[chime{n}]" for n in range(image_count)]
+        filters.append(f"[{chime_index}:a]{audio_format},asplit={image_count}{''.join(chime_labels)}")
+
+    concat_inputs = []
+    image_n = 0
+    for n, item in enumerate(timeline):
+        index = item['input']
+        duration = f"{item['duration']:.3f}"
+        mode = scale_mode if item['type'] == 'video' else 'stretch'
+        filters.append(_video_chain(f"[{index}:v]", output['size'], fps, mode, tag=str(n))
+                       + f",trim=duration={duration},setpts=PTS-STARTPTS[v{n}]")
+
+        if item['type'] == 'image' and chime_labels:
+            audio_source = chime_labels[image_n] + "apad,"
+        elif item['type'] == 'video' and item.get('has_audio'):
+            audio_source = f"[{index}:a]{audio_format},apad,"
+        else:
+            audio_source = f"anullsrc=r={sample_rate}:cl=stereo,{audio_format},"
+        if item['type'] == 'image':
+            image_n += 1
+        filters.append(f"{audio_source}atrim=duration={duration},asetpts=PTS-STARTPTS[a{n}]")
+        concat_inputs.append(f"[v{n}][a{n}]")
+
+    filters.append(f"{''.join(concat_inputs)}concat=n={len(timeline)}:v=1:a=1[outv][outa]")
+    return ';\n'.join(filters), '[outv]', '[outa]'
+
+
+def render_timeline(items, output_path, chime_path=None, output=None, threads=None, scale_mode='stretch',
+                    renditions=None):
+    """使用一次ffmpeg调用渲染整个时间线，画面数据不经过Python
+
+    items 为 {'type': 'image' 或 'video', 'path': 文件路径, 'duration': 秒, 'has_audio': bool} 列表，
+    视频项从可选的 'start' 秒开始读取 duration 秒（即裁剪掉开头和结尾）。
+    renditions 为 [(输出路径, 输出版本)]：合成后的画面用 split 分给每个版本的编码器，与主输出在同一次调用中完成。
+    """
+    output = output or DEFAULT_OUTPUT
+    args = []
+    timeline = []
+    for index, item in enumerate(items):
+        duration = f"{item['duration']:.3f}"
+        if item['type'] == 'image':
+            args += ['-loop', '1', '-framerate', str(output['fps']), '-t', duration, '-i', item['path']]
+        else:
+            if item.get('start'):
+                args += ['-ss', f"{item['start']:.3f}"]
+            args += ['-t', duration, '-i', item['path']]
+        timeline.append(dict(item, input=index))
+
+    chime_index = None
+    if chime_path and os.path.exists(chime_path):
+        chime_index = len(items)
+        args += ['-i', chime_path]
+    else:
+        logging.warning(f"未找到音效文件 {chime_path}，过渡画面使用静音")
+
+    graph, video_label, audio_label = build_filter_graph(timeline, chime_index, output, scale_mode)
+    rendition_labels = []
+    if renditions:
+        filters, video_outputs = fan_out_filters(video_label, renditions, keep='[mainv]')
+        audio_outputs = [f"[ra{n}]" for n in range(len(renditions))]
+        filters.append(f"{audio_label}asplit={len(renditions) + 1}[maina]{''.join(audio_outputs)}")
+        graph = ';\n'.join([graph] + filters)
+        video_label, audio_label = '[mainv]', '[maina]'
+        rendition_labels = list(zip(video_outputs, audio_outputs))
+
+    # 过长的滤镜图写入文件，避免超过命令行长度限制
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as script:
+        script.write(graph)
+        script_path = script.name
+    try:
+        args += ['-filter_complex_script', script_path,
+                 '-map', video_label, '-map', audio_label,
+                 '-c:v', 'libx264', '-preset', output['preset'], '-b:v', output['bitrate'],
+                 '-pix_fmt', 'yuv420p', '-r', str(output['fps']),
+                 '-c:a', 'aac', '-b:a', output['audio_bitrate'], '-ar', str(output['sample_rate']), '-ac', '2',
+                 '-movflags', '+faststart']
+        if threads:
+            args += ['-threads', str(threads)]
+        args.append(output_path)
+        for (path, profile), (video_output, audio_output) in zip(renditions or [], rendition_labels):
+            args += ['-map', video_output, '-map', audio_output]
+            args += encoder_args(profile, output['fps'], output['sample_rate']) + [path]
+        logging.info(f"ffmpeg渲染: {len(items)} 个片段，{1 + len(rendition_labels)} 个输出，单次调用")
+        run_ffmpeg(args, "ffmpeg渲染")
+    finally:
+        os.remove(script_path)
+    return output_path
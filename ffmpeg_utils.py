@@ -0,0 +1,193 @@
+import os
+import json
+import shutil
+import logging
+import subprocess
+from fractions import Fraction
+
+
+def get_ffmpeg_exe():
+    """获取ffmpeg可执行文件路径（与moviepy使用同一个ffmpeg）"""
+    exe = os.environ.get('FFMPEG_BINARY')
+    if exe and exe != 'ffmpeg-imageio':
+        return exe
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which('ffmpeg')
+
+
+def get_ffprobe_exe():
+    """获取ffprobe可执行文件路径，找不到时返回None"""
+    exe = os.environ.get('FFPROBE_BINARY') or shutil.which('ffprobe')
+    if exe:
+        return exe
+    # 尝试在ffmpeg同目录下查找
+    ffmpeg = get_ffmpeg_exe()
+    if ffmpeg:
+        directory, name = os.path.split(ffmpeg)
+        candidate = os.path.join(directory, name.replace('ffmpeg', 'ffprobe', 1))
+        if candidate != ffmpeg and os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def run_ffmpeg(args, description="ffmpeg", input=None):
+    """运行ffmpeg命令，失败时抛出带错误输出的异常；input 为写入标准输入的数据"""
+    ffmpeg = get_ffmpeg_exe()
+    if not ffmpeg:
+        raise RuntimeError("未找到ffmpeg")
+    cmd = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-y'] + list(args)
+    logging.debug(f"运行命令: {' '.join(cmd)}")
+    result = subprocess.run(cmd, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        error = result.stderr.decode('utf-8', errors='replace').strip()
+        raise RuntimeError(f"{description} 失败: {error[-500:]}")
+    return result
+
+
+def _parse_rate(value):
+    """解析ffprobe的帧率字符串（如 30000/1001）"""
+    try:
+        rate = Fraction(value)
+        return float(rate) if rate > 0 else None
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _parse_rotation(stream):
+    """读取视频流的旋转角度"""
+    rotate = stream.get('tags', {}).get('rotate')
+    if rotate is not None:
+        try:
+            return int(float(rotate)) % 360
+        except ValueError:
+            pass
+    for side_data in stream.get('side_data_list', []):
+        if 'rotation' in side_data:
+            try:
+                return int(float(side_data['rotation'])) % 360
+            except (TypeError, ValueError):
+                pass
+    return 0
+
+
+def probe_video(path):
+    """使用ffprobe读取视频参数，失败时返回None"""
+    ffprobe = get_ffprobe_exe()
+    if not ffprobe:
+        return None
+    cmd = [ffprobe, '-v', 'error', '-print_format', 'json',
+           '-show_format', '-show_streams', path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        data = json.loads(result.stdout.decode('utf-8', errors='replace'))
+    except Exception as e:
+        logging.debug(f"探测视频失败 {path}: {str(e)}")
+        return None
+
+    streams = data.get('streams', [])
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    if video is None:
+        return None
+
+    try:
+        duration = float(data.get('format', {}).get('duration') or video.get('duration') or 0)
+    except ValueError:
+        duration = 0.0
+
+    frame_rate = video.get('avg_frame_rate')
+    if not _parse_rate(frame_rate):
+        frame_rate = video.get('r_frame_rate')
+
+    info = {
+        'path': path,
+        'duration': duration,
+        'width': video.get('width'),
+        'height': video.get('height'),
+        'fps': _parse_rate(frame_rate),
+        'frame_rate': frame_rate,
+        'vcodec': video.get('codec_name'),
+        'profile': video.get('profile'),
+        'level': video.get('level'),
+        'pix_fmt': video.get('pix_fmt'),
+        'time_base': video.get('time_base'),
+        'rotation': _parse_rotation(video),
+        'acodec': None,
+        'sample_rate': None,
+        'channels': None,
+    }
+    if audio is not None:
+        info['acodec'] = audio.get('codec_name')
+        info['sample_rate'] = int(audio.get('sample_rate') or 0) or None
+        info['channels'] = audio.get('channels')
+    return info
+
+
+def probe_keyframes(path):
+    """读取视频流所有关键帧的时间点（只读取数据包，不解码），失败时返回None"""
+    ffprobe = get_ffprobe_exe()
+    if not ffprobe:
+        return None
+    cmd = [ffprobe, '-v', 'error', '-select_streams', 'v:0',
+           '-show_entries', 'packet=pts_time,flags', '-of', 'csv=print_section=0', path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    except Exception as e:
+        logging.debug(f"读取关键帧失败 {path}: {str(e)}")
+        return None
+
+    keyframes = []
+    for line in result.stdout.decode('utf-8', errors='replace').splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or 'K' not in parts[1]:
+            continue
+        try:
+            keyframes.append(float(parts[0]))
+        except ValueError:
+            continue
+    return sorted(keyframes)
+
+
+def keyframe_interval(keyframes):
+    """关键帧平均间隔（秒），不足两个关键帧时返回None"""
+    if not keyframes or len(keyframes) < 2:
+        return None
+    return (keyframes[-1] - keyframes[0]) / (len(keyframes) - 1)
+
+
+# 缩放方式：拉伸填满 / 保持比例加黑边（上下或左右） / 保持比例并用模糊画面填充背景
+SCALE_MODES = ('stretch', 'fit', 'blur')
+
+
+def scale_filter(size, mode='stretch', tag=''):
+    """生成把画面缩放到目标尺寸的ffmpeg滤镜链（在ffmpeg内部完成，不经过Python）
+
+    tag 用于区分同一个 filter_complex 中多个模糊背景的中间标签
+    """
+    width, height = size
+    if mode == 'stretch':
+        return f"scale={width}:{height},setsar=1"
+    if mode == 'fit':
+        return (f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2:color=black,setsar=1")
+    if mode == 'blur':
+        # 背景先缩小到1/8再模糊和放大，代价很小
+        bg_width, bg_height = width // 8, height // 8
+        return (f"split[bg{tag}][fg{tag}];"
+                f"[bg{tag}]scale={bg_width}:{bg_height}:force_original_aspect_ratio=increase,"
+                f"crop={bg_width}:{bg_height},boxblur=8:2,scale={width}:{height}[bgb{tag}];"
+                f"[fg{tag}]scale={width}:{height}:force_original_aspect_ratio=decrease[fgs{tag}];"
+                f"[bgb{tag}][fgs{tag}]overlay=(W-w)/2:(H-h)/2,setsar=1")
+    raise ValueError(f"未知的缩放方式: {mode}")
+
+
+def fit_size(source_size, size):
+    """保持宽高比缩放到目标尺寸以内，返回 (宽, 高)"""
+    src_width, src_height = source_size
+    width, height = size
+    scale = min(width / src_width, height / src_height)
+    return (min(width, max(2, round(src_width * scale))),
+            min(height, max(2, round(src_height * scale))))
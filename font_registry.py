@@ -0,0 +1,184 @@
+import os
+import re
+import shutil
+import logging
+import subprocess
+import threading
+from PIL import ImageFont
+
+# 按优先级排列的字体文件名（不区分大小写）
+LATIN_FONT_NAMES = [
+    'arial.ttf',
+    'helvetica.ttc',
+    'dejavusans.ttf',
+    'liberationsans-regular.ttf',
+    'notosans-regular.ttf',
+]
+CJK_FONT_NAMES = [
+    'msyh.ttc',                     # 微软雅黑
+    'msyh.ttf',
+    'simhei.ttf',                   # 黑体
+    'pingfang.ttc',
+    'hiragino sans gb.ttc',
+    'stheiti medium.ttc',
+    'notosanscjk-regular.ttc',
+    'notosanscjksc-regular.otf',
+    'notosanssc-regular.otf',
+    'sourcehansanssc-regular.otf',
+    'wqy-microhei.ttc',
+    'wqy-zenhei.ttc',
+    'droidsansfallbackfull.ttf',
+]
+FONT_EXTENSIONS = ('.ttf', '.ttc', '.otf')
+
+# fontconfig 配置文件位置
+FONTCONFIG_FILES = ['/etc/fonts/fonts.conf', '/usr/local/etc/fonts/fonts.conf']
+
+
+def _fontconfig_dirs():
+    """从fontconfig配置文件中读取字体目录"""
+    dirs = []
+    for conf in FONTCONFIG_FILES:
+        try:
+            with open(conf, 'r', encoding='utf-8', errors='replace') as file:
+                content = file.read()
+        except OSError:
+            continue
+        for match in re.finditer(r'<dir[^>]*>([^<]+)</dir>', content):
+            dirs.append(os.path.expanduser(match.group(1).strip()))
+    return dirs
+
+
+def default_search_paths():
+    """默认字体搜索路径：环境变量 FONT_PATH、当前目录、系统字体目录和fontconfig目录"""
+    paths = []
+    env_paths = os.environ.get('FONT_PATH')
+    if env_paths:
+        paths.extend(p for p in env_paths.split(os.pathsep) if p)
+    paths.append(os.getcwd())
+    windir = os.environ.get('WINDIR', 'C:\\Windows')
+    paths.append(os.path.join(windir, 'Fonts'))
+    paths += [
+        '/System/Library/Fonts',
+        '/Library/Fonts',
+        os.path.expanduser('~/Library/Fonts'),
+        '/usr/share/fonts',
+        '/usr/local/share/fonts',
+        os.path.expanduser('~/.fonts'),
+        os.path.expanduser('~/.local/share/fonts'),
+    ]
+    paths += _fontconfig_dirs()
+
+    # 去重并保持顺序
+    seen = set()
+    result = []
+    for path in paths:
+        key = os.path.normcase(os.path.abspath(path))
+        if key not in seen:
+            seen.add(key)
+            result.append(path)
+    return result
+
+
+class FontRegistry:
+    """字体注册表：每个进程只查找一次字体文件，并按字号缓存加载后的字体对象"""
+
+    def __init__(self, search_paths=None):
+        self.search_paths = search_paths if search_paths is not None else default_search_paths()
+        self._resolution = None
+        self._fonts = {}
+        self._lock = threading.Lock()
+
+    def _index_fonts(self):
+        """扫描搜索路径，建立 文件名 -> 路径 的索引（同名时前面的目录优先）"""
+        index = {}
+        for directory in self.search_paths:
+            if not os.path.isdir(directory):
+                continue
+            # 当前目录不递归，避免扫描大量视频文件
+            if os.path.abspath(directory) == os.getcwd():
+                walker = [(directory, [], os.listdir(directory))]
+            else:
+                walker = os.walk(directory)
+            for root, _, files in walker:
+                for name in files:
+                    if name.lower().endswith(FONT_EXTENSIONS):
+                        index.setdefault(name.lower(), os.path.join(root, name))
+        return index
+
+    @staticmethod
+    def _fc_match(pattern):
+        """通过fc-match查找字体（仅在按文件名找不到时使用）"""
+        fc_match = shutil.which('fc-match')
+        if not fc_match:
+            return None
+        try:
+            result = subprocess.run([fc_match, '-f', '%{file}', pattern],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=5)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        path = result.stdout.decode('utf-8', errors='replace').strip()
+        return path if path and os.path.isfile(path) else None
+
+    def resolve(self):
+        """查找拉丁字体和中文字体，返回 {'latin': 路径, 'cjk': 路径}，找不到时为None"""
+        with self._lock:
+            if self._resolution is None:
+                index = self._index_fonts()
+                latin = next((index[n] for n in LATIN_FONT_NAMES if n in index), None)
+                cjk = next((index[n] for n in CJK_FONT_NAMES if n in index), None)
+                if cjk is None:
+                    cjk = self._fc_match(':lang=zh')
+                if latin is None:
+                    latin = self._fc_match('sans-serif:lang=en')
+                self._resolution = {'latin': latin, 'cjk': cjk}
+                logging.info(f"字体: 拉丁 {latin or '默认字体'}，中文 {cjk or '未找到'}")
+        return dict(self._resolution)
+
+    @property
+    def resolution(self):
+        return self.resolve()
+
+    def get_font(self, kind, size):
+        """获取指定类型（'latin' 或 'cjk'）和字号的字体，找不到时回退到另一类字体或默认字体"""
+        key = (kind, size)
+        font = self._fonts.get(key)
+        if font is not None:
+            return font
+
+        resolution = self.resolve()
+        other = 'latin' if kind == 'cjk' else 'cjk'
+        for path in (resolution.get(kind), resolution.get(other)):
+            if not path:
+                continue
+            try:
+                font = ImageFont.truetype(path, size)
+                break
+            except OSError as e:
+                logging.debug(f"加载字体失败 {path}: {str(e)}")
+        if font is None:
+            try:
+                font = ImageFont.load_default(size)
+            except TypeError:  # 旧版Pillow不支持字号参数
+                font = ImageFont.load_default()
+
+        self._fonts[key] = font
+        return font
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """获取进程内共享的字体注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = FontRegistry()
+    return _registry
+
+
+def get_font(kind, size):
+    """从共享注册表获取字体"""
+    return get_registry().get_font(kind, size)
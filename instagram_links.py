@@ -0,0 +1,75 @@
+import io
+import os
+import re
+from urllib.parse import urlsplit
+
+# 所有正则只在导入时编译一次
+INSTAGRAM_URL = re.compile(r'https?://(?:www\.)?instagram\.com/[^\s"\'<>()\[\]]*')
+# 帖子、Reel、IGTV：/reel/短代码、/p/短代码、/tv/短代码，也支持 /用户名/reel/短代码 的分享格式
+POST_PATH = re.compile(r'/(?:[A-Za-z0-9_.]+/)?(reels?|p|tv)/([A-Za-z0-9_-]+)')
+# 分享链接：/share/令牌、/share/reel/令牌，令牌不是短代码，需要访问后重定向到真正的帖子
+SHARE_PATH = re.compile(r'/share/')
+# 快拍：/stories/用户名/编号
+STORY_PATH = re.compile(r'/stories/([A-Za-z0-9_.]+)/(\d+)')
+# 同一个帖子可以用 /p/、/reel/、/tv/ 访问，短代码相同
+POST_KINDS = ('reel', 'p', 'tv')
+# 文本末尾常见的标点
+TRAILING_PUNCTUATION = '.,;:!?。，；：！？'
+
+
+def canonicalize_link(url):
+    """把链接规范化为 (类型, 短代码)；类型为 reel / p / tv / stories，无法识别的链接返回 ('link', 路径)
+
+    分享链接中的令牌不是短代码，返回 ('share', 路径)。
+    """
+    path = urlsplit(url).path
+    if SHARE_PATH.match(path):
+        return 'share', path.rstrip('/' + TRAILING_PUNCTUATION)
+    match = POST_PATH.match(path)
+    if match:
+        kind = 'reel' if match.group(1) == 'reels' else match.group(1)
+        return kind, match.group(2)
+    match = STORY_PATH.match(path)
+    if match:
+        return 'stories', f'{match.group(1)}/{match.group(2)}'
+    return 'link', path.rstrip('/' + TRAILING_PUNCTUATION)
+
+
+def canonical_url(kind, shortcode):
+    """由 (类型, 短代码) 生成不带查询参数的标准链接"""
+    if kind == 'link':
+        return f'https://www.instagram.com{shortcode}/'
+    return f'https://www.instagram.com/{kind}/{shortcode}/'
+
+
+def iter_lines(source):
+    """逐行读取：source 为文件路径时从文件读取，否则当作文本"""
+    if os.path.isfile(source):
+        with open(source, 'r', encoding='utf-8', errors='replace') as file:
+            yield from file
+    else:
+        yield from io.StringIO(source)
+
+
+def iter_instagram_links(source):
+    """逐行扫描文件或文本，产出 (类型, 短代码, 标准链接)
+
+    同一个视频的不同链接（如带不同的 ?igsh= / ?utm_ 参数，或 /p/ 和 /reel/）只产出一次，保持第一次出现的顺序。
+    分享链接保留原始地址，由下载器跟随重定向。
+    """
+    seen = set()
+    for line in iter_lines(source):
+        if 'instagram.com' not in line:
+            continue
+        for match in INSTAGRAM_URL.finditer(line):
+            kind, shortcode = canonicalize_link(match.group(0))
+            if kind == 'link' and not shortcode:
+                continue
+            key = ('post' if kind in POST_KINDS else kind, shortcode)
+            if key in seen:
+                continue
+            seen.add(key)
+            if kind == 'share':
+                yield kind, shortcode, match.group(0).rstrip(TRAILING_PUNCTUATION)
+            else:
+                yield kind, shortcode, canonical_url(kind, shortcode)
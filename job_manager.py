@@ -0,0 +1,200 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 后台线程总数，以及各类任务同时运行的数量上限（未列出的类型为1）
+DEFAULT_WORKERS = 4
+DEFAULT_LIMITS = {'download': 1, 'merge': 2}
+# 最多保留的已结束任务记录
+MAX_FINISHED_JOBS = 100
+
+STATUS_NAMES = {
+    'queued': '排队中',
+    'running': '运行中',
+    'done': '已完成',
+    'failed': '失败',
+    'cancelled': '已取消',
+}
+KIND_NAMES = {'download': '下载', 'merge': '合并'}
+
+
+class JobCancelled(BaseException):
+    """任务被取消
+
+    继承 BaseException，处理流程中捕获 Exception 后改用备用方案的代码不会把取消当作普通错误继续执行。
+    """
+
+
+class Job:
+    """一个后台任务：保存状态、阶段、进度和结果，任务函数通过 progress 回调报告进度"""
+
+    def __init__(self, kind, fn, args, kwargs, resource=None):
+        self.id = uuid.uuid4().hex[:8]
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.resource = resource
+        self.status = 'queued'
+        self.stage = STATUS_NAMES['queued']
+        self.percent = 0.0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+        self._version = 0
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed', 'cancelled')
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def _update(self, **fields):
+        with self._changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self._version += 1
+            self._changed.notify_all()
+
+    def progress(self, stage, percent=None):
+        """进度回调：更新阶段和百分比，任务已被取消时抛出 JobCancelled"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        fields = {'stage': stage}
+        if percent is not None:
+            fields['percent'] = max(0.0, min(100.0, float(percent)))
+        self._update(**fields)
+
+    def describe(self):
+        """生成显示在界面上的任务状态文本"""
+        lines = [f"任务 {self.id}（{KIND_NAMES.get(self.kind, self.kind)}）",
+                 f"状态: {STATUS_NAMES[self.status]}"]
+        if self.status == 'running':
+            if self.cancel_requested:
+                lines.append("正在取消...")
+            lines.append(f"阶段: {self.stage}")
+            lines.append(f"进度: {self.percent:.0f}%")
+        elapsed = (self.finished_at or time.time()) - self.created
+        lines.append(f"用时: {elapsed:.0f} 秒")
+        if self.result is not None:
+            lines.append(str(self.result))
+        if self.error is not None:
+            lines.append(f"错误: {self.error}")
+        return '\n'.join(lines)
+
+    def watch(self, interval=1.0):
+        """生成器：状态变化（或每隔 interval 秒）时产出状态文本，任务结束后停止"""
+        version = None
+        while True:
+            with self._changed:
+                if self._version == version and not self.finished:
+                    self._changed.wait(interval)
+                version = self._version
+                finished = self.finished
+            yield self.describe()
+            if finished:
+                return
+
+
+class JobManager:
+    """后台任务管理：有界线程池执行下载和合并，按任务类型限制并发数，支持取消
+
+    提交时可以指定 resource（例如输出文件路径），占用同一资源的任务依次执行，避免多个用户同时写同一个文件。
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS, limits=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._queue = []
+        self._running = {}
+        self._busy = set()
+
+    def submit(self, kind, fn, *args, resource=None, **kwargs):
+        """提交任务，fn 以 fn(*args, progress=回调, **kwargs) 的形式调用，返回 Job"""
+        job = Job(kind, fn, args, kwargs, resource)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            self._prune()
+            self._dispatch()
+        return job
+
+    def _dispatch(self):
+        """按提交顺序启动不超过并发上限、资源空闲的任务（调用时已持有锁）"""
+        for job in list(self._queue):
+            if self._running.get(job.kind, 0) >= self.limits.get(job.kind, 1):
+                continue
+            if job.resource is not None and job.resource in self._busy:
+                continue
+            self._queue.remove(job)
+            self._running[job.kind] = self._running.get(job.kind, 0) + 1
+            if job.resource is not None:
+                self._busy.add(job.resource)
+            job._update(status='running', stage='开始')
+            self._pool.submit(self._run, job)
+
+    def _run(self, job):
+        try:
+            result = job.fn(*job.args, progress=job.progress, **job.kwargs)
+            job._update(status='done', stage='完成', percent=100.0, result=result, finished_at=time.time())
+        except JobCancelled:
+            job._update(status='cancelled', stage=STATUS_NAMES['cancelled'], finished_at=time.time())
+        except Exception as e:
+            logging.error(f"任务 {job.id} 失败: {str(e)}")
+            job._update(status='failed', error=str(e), finished_at=time.time())
+        finally:
+            with self._lock:
+                self._running[job.kind] -= 1
+                self._busy.discard(job.resource)
+                self._dispatch()
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务直接移除，运行中的任务在下一次报告进度时停止。返回是否已请求取消"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            job._cancel.set()
+            if job in self._queue:
+                self._queue.remove(job)
+                job._update(status='cancelled', stage=STATUS_NAMES['cancelled'], finished_at=time.time())
+            else:
+                job._update()
+        return True
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self):
+        """只保留最近的已结束任务记录（调用时已持有锁）"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """获取进程内共享的任务管理器"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+    return _manager
@@ -0,0 +1,94 @@
+import numpy as np
+from PIL import Image, ImageFilter
+from proglog import ProgressBarLogger
+from moviepy.video.io.VideoFileClip import VideoFileClip
+from moviepy.audio.io.AudioFileClip import AudioFileClip
+from moviepy.audio.AudioClip import AudioClip
+from moviepy.video.VideoClip import VideoClip
+
+# moviepy相关的类和函数：导入moviepy较慢，video_merger 只在使用moviepy合并时才导入本模块
+
+
+def fill_frame(frame, size=(720, 1280), scale_mode='stretch'):
+    """把解码器输出的画面放到目标尺寸的画布中央，背景为黑色或模糊画面"""
+    width, height = size
+    frame_height, frame_width = frame.shape[:2]
+    if (frame_width, frame_height) == (width, height):
+        return frame
+
+    if scale_mode == 'blur':
+        # 在1/8尺寸上裁剪和模糊，再放大作为背景
+        small_width, small_height = max(1, width // 8), max(1, height // 8)
+        scale = max(small_width / frame_width, small_height / frame_height)
+        background = Image.fromarray(frame).resize(
+            (max(small_width, round(frame_width * scale)), max(small_height, round(frame_height * scale))),
+            Image.BILINEAR)
+        left = (background.width - small_width) // 2
+        top = (background.height - small_height) // 2
+        background = background.crop((left, top, left + small_width, top + small_height))
+        background = background.filter(ImageFilter.GaussianBlur(6)).resize((width, height), Image.BILINEAR)
+        canvas = np.array(background)
+    else:
+        canvas = np.zeros((height, width, 3), dtype=frame.dtype)
+
+    x = (width - frame_width) // 2
+    y = (height - frame_height) // 2
+    canvas[y:y + frame_height, x:x + frame_width] = frame[:height, :width]
+    return canvas
+
+
+class LazyAudioFileClip(AudioClip):
+    """按需打开的音频片段，从源文件的 start 秒开始，读取器由 ReaderPool 管理"""
+
+    def __init__(self, path, duration, pool, fps=44100, start=0.0):
+        AudioClip.__init__(self, duration=duration, fps=fps)
+        self.path = path
+        self.pool = pool
+        self.start_offset = start
+        self.nchannels = 2  # ffmpeg音频读取器统一输出双声道
+
+    def make_frame(self, t):
+        reader = self.pool.acquire(('audio', self.path), lambda: AudioFileClip(self.path, fps=self.fps))
+        return reader.get_frame(t + self.start_offset)
+
+
+class LazyVideoFileClip(VideoClip):
+    """按需打开的视频片段：时间线播放到该片段时才打开源文件，读取器数量由 ReaderPool 限制
+
+    片段从源文件的 start 秒开始，持续 duration 秒。
+    """
+
+    def __init__(self, path, duration, pool, size=(720, 1280), has_audio=True, decode_size=None, scale_mode='stretch',
+                 start=0.0):
+        VideoClip.__init__(self, duration=duration)
+        self.path = path
+        self.pool = pool
+        self.start_offset = start
+        self.size = tuple(size)
+        self.decode_size = tuple(decode_size or size)
+        self.scale_mode = scale_mode
+        if has_audio:
+            self.audio = LazyAudioFileClip(path, duration, pool, start=start)
+
+    def make_frame(self, t):
+        width, height = self.decode_size
+        reader = self.pool.acquire(('video', self.path), lambda: VideoFileClip(
+            self.path, audio=False, target_resolution=(height, width)))
+        return fill_frame(reader.get_frame(t + self.start_offset), self.size, self.scale_mode)
+
+
+class MergeProgressLogger(ProgressBarLogger):
+    """把moviepy写入文件的帧进度转发给合并的 progress 回调"""
+
+    def __init__(self, progress, start=30, end=100, stage="写入文件"):
+        super().__init__()
+        self.progress = progress
+        self.start = start
+        self.end = end
+        self.stage = stage
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar == 't' and attr == 'index':
+            total = self.bars[bar].get('total')
+            if total:
+                self.progress(self.stage, self.start + (self.end - self.start) * value / total)
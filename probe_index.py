@@ -0,0 +1,150 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from ffmpeg_utils import probe_video, probe_keyframes, keyframe_interval
+
+# 每个媒体目录下的索引文件
+INDEX_NAME = '.probe_index.sqlite'
+INDEX_VERSION = 1
+VIDEO_EXTENSIONS = ('.mp4', '.MP4', '.mov', '.MOV')
+# 同时运行的ffprobe进程数
+PROBE_WORKERS = 4
+
+
+class ProbeIndex:
+    """媒体目录的探测索引：缓存ffprobe结果，按 路径 + 大小 + 修改时间 判断是否失效
+
+    gallery刷新、合并规划、快速合并兼容性检查都从索引读取，只有新增或修改过的文件才会重新探测。
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        self.path = os.path.join(self.directory, INDEX_NAME)
+        self._lock = threading.Lock()
+        self._memory = None  # 目录不可写时使用的内存数据库
+        with self._connect() as conn:
+            self._init_schema(conn)
+
+    @contextmanager
+    def _connect(self):
+        """每次操作单独打开连接，不长期占用索引文件（Windows下临时目录才能被删除）"""
+        if self._memory is not None:
+            with self._lock, self._memory:
+                yield self._memory
+            return
+        try:
+            conn = sqlite3.connect(self.path, timeout=10)
+        except sqlite3.Error as e:
+            logging.debug(f"无法打开探测索引 {self.path}: {str(e)}")
+            self._memory = sqlite3.connect(':memory:', check_same_thread=False)
+            self._init_schema(self._memory)
+            with self._lock, self._memory:
+                yield self._memory
+            return
+        try:
+            with self._lock, conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _init_schema(conn):
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or int(row[0]) != INDEX_VERSION:
+            conn.execute('DROP TABLE IF EXISTS probes')
+            conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(INDEX_VERSION),))
+        conn.execute('CREATE TABLE IF NOT EXISTS probes ('
+                     'name TEXT PRIMARY KEY, size INTEGER, mtime REAL, info TEXT)')
+
+    def _lookup(self, conn, name, stat):
+        row = conn.execute('SELECT size, mtime, info FROM probes WHERE name = ?', (name,)).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime:
+            return None
+        return json.loads(row[2])
+
+    @staticmethod
+    def _probe_file(path):
+        """探测单个文件：基本参数 + 关键帧位置"""
+        info = probe_video(path)
+        if info is None:
+            return None
+        keyframes = probe_keyframes(path)
+        info['keyframes'] = keyframes
+        info['keyframe_interval'] = keyframe_interval(keyframes)
+        return info
+
+    def probe_many(self, paths):
+        """批量获取探测结果（顺序与输入一致），只探测索引中没有或已变化的文件"""
+        results = [None] * len(paths)
+        missing = []
+        with self._connect() as conn:
+            for n, path in enumerate(paths):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                name = os.path.basename(path)
+                info = self._lookup(conn, name, stat)
+                if info is not None:
+                    info['path'] = path
+                    results[n] = info
+                else:
+                    missing.append((n, path, name, stat))
+
+        if missing:
+            logging.info(f"探测 {len(missing)} 个新增或修改过的视频")
+            with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+                infos = list(pool.map(lambda item: self._probe_file(item[1]), missing))
+            with self._connect() as conn:
+                for (n, path, name, stat), info in zip(missing, infos):
+                    if info is not None:
+                        conn.execute('INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)',
+                                     (name, stat.st_size, stat.st_mtime, json.dumps(info, ensure_ascii=False)))
+                    results[n] = info
+        return results
+
+    def probe(self, path):
+        return self.probe_many([path])[0]
+
+    def list_videos(self, extensions=VIDEO_EXTENSIONS):
+        """列出目录中的视频文件（按文件名排序），同时删除已不存在文件的索引记录"""
+        names = sorted(entry.name for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.endswith(extensions))
+        present = set(names)
+        with self._connect() as conn:
+            indexed = [row[0] for row in conn.execute('SELECT name FROM probes')]
+            stale = [(name,) for name in indexed if name not in present]
+            if stale:
+                conn.executemany('DELETE FROM probes WHERE name = ?', stale)
+        return [os.path.join(self.directory, name) for name in names]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(directory):
+    """获取目录对应的索引（进程内共享）"""
+    directory = os.path.abspath(directory)
+    with _indexes_lock:
+        if directory not in _indexes:
+            _indexes[directory] = ProbeIndex(directory)
+        return _indexes[directory]
+
+
+def probe_videos(paths):
+    """批量探测视频，按所在目录使用对应的索引，返回与输入顺序一致的结果"""
+    results = [None] * len(paths)
+    by_directory = {}
+    for n, path in enumerate(paths):
+        by_directory.setdefault(os.path.dirname(os.path.abspath(path)), []).append(n)
+    for directory, positions in by_directory.items():
+        infos = get_index(directory).probe_many([paths[n] for n in positions])
+        for n, info in zip(positions, infos):
+            results[n] = info
+    return results
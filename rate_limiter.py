@@ -0,0 +1,77 @@
+import time
+import random
+import threading
+from urllib.parse import urlparse
+
+# 每个域名的默认请求速率（每秒令牌数）、突发容量和随机抖动上限（秒）
+DEFAULT_RATE = 0.5
+DEFAULT_BURST = 2
+DEFAULT_JITTER = 1.5
+
+
+class TokenBucket:
+    """令牌桶：以 rate 个/秒的速度补充令牌，最多积累 capacity 个"""
+
+    def __init__(self, rate=DEFAULT_RATE, capacity=DEFAULT_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = float(capacity)
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """取出一个令牌，返回需要等待的秒数（令牌不足时预支，等待结束后令牌即归属调用者）"""
+        with self._lock:
+            self._refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def penalize(self, seconds):
+        """清空令牌并额外暂停 seconds 秒（请求失败或被限流时使用）"""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+
+class HostRateLimiter:
+    """按域名分别限速：同一域名的请求共享一个令牌桶，每次放行后再随机等待一小段时间"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, jitter=DEFAULT_JITTER, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url):
+        return (urlparse(url).hostname or '').lower()
+
+    def _bucket(self, host):
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def acquire(self, url):
+        """等待直到可以向 url 所在域名发出请求，返回实际等待的秒数"""
+        delay = self._bucket(self.host_of(url)).reserve()
+        if self.jitter:
+            delay += random.uniform(0, self.jitter)
+        if delay > 0:
+            self.sleep(delay)
+        return delay
+
+    def penalize(self, url, seconds):
+        """请求失败后让该域名暂停 seconds 秒"""
+        self._bucket(self.host_of(url)).penalize(seconds)
@@ -0,0 +1,119 @@
+import os
+import re
+import logging
+import tempfile
+from ffmpeg_utils import run_ffmpeg, scale_filter
+
+# 预设的输出版本：尺寸、码率（bitrate）或质量（crf）、编码预设、音频码率
+OUTPUT_PROFILES = {
+    'master': {'size': (720, 1280), 'bitrate': '4000k', 'preset': 'medium', 'audio_bitrate': '192k'},
+    '480p': {'size': (480, 854), 'bitrate': '1200k', 'preset': 'fast', 'audio_bitrate': '128k'},
+    'preview': {'size': (360, 640), 'crf': 32, 'preset': 'veryfast', 'audio_bitrate': '64k'},
+}
+# 自定义版本的格式：名称=宽x高:码率或crf值:编码预设，如 540p=540x960:2000k:fast、small=360x640:crf30
+PROFILE_SPEC = re.compile(r'(?P<name>[\w-]+)=(?P<width>\d+)x(?P<height>\d+)'
+                          r'(?::(?:crf(?P<crf>\d+)|(?P<bitrate>\d+[kKmM])))?(?::(?P<preset>\w+))?')
+
+
+def parse_profile(spec):
+    """解析输出版本：预设名称、字典或 名称=宽x高:码率:预设 字符串，返回带 name 的字典"""
+    if isinstance(spec, dict):
+        profile = dict(OUTPUT_PROFILES.get(spec.get('name'), {}), **spec)
+    elif spec in OUTPUT_PROFILES:
+        profile = dict(OUTPUT_PROFILES[spec], name=spec)
+    else:
+        match = PROFILE_SPEC.fullmatch(str(spec).strip())
+        if not match:
+            raise ValueError(f"无法解析输出版本: {spec}（可用预设: {', '.join(OUTPUT_PROFILES)}）")
+        profile = {'name': match.group('name'), 'size': (int(match.group('width')), int(match.group('height'))),
+                   'preset': match.group('preset') or 'medium', 'audio_bitrate': '128k'}
+        if match.group('crf'):
+            profile['crf'] = int(match.group('crf'))
+        else:
+            profile['bitrate'] = match.group('bitrate') or '2000k'
+    if 'name' not in profile or 'size' not in profile:
+        raise ValueError(f"输出版本缺少名称或尺寸: {spec}")
+    if any(value % 2 for value in profile['size']):
+        raise ValueError(f"输出版本的宽高必须是偶数: {profile['name']}")
+    profile['size'] = tuple(profile['size'])
+    return profile
+
+
+def rendition_path(output_path, name):
+    """输出版本的文件路径：主输出文件名加上版本名称，如 final-480p.mp4"""
+    stem, ext = os.path.splitext(output_path)
+    return f"{stem}-{name}{ext or '.mp4'}"
+
+
+def plan_renditions(output_path, specs):
+    """把版本列表解析为 [(输出路径, 版本)]，没有指定 path 时放在主输出文件旁边"""
+    renditions = []
+    for spec in specs or []:
+        profile = parse_profile(spec)
+        path = os.path.abspath(profile.get('path') or rendition_path(output_path, profile['name']))
+        renditions.append((path, profile))
+    return renditions
+
+
+def encoder_args(profile, fps=30, sample_rate=44100):
+    """一个输出版本的编码参数（放在输出文件名之前）"""
+    args = ['-c:v', 'libx264', '-preset', profile.get('preset', 'medium')]
+    if profile.get('crf') is not None:
+        args += ['-crf', str(profile['crf'])]
+    else:
+        args += ['-b:v', profile.get('bitrate', '2000k')]
+    args += ['-pix_fmt', 'yuv420p', '-r', str(profile.get('fps', fps)),
+             '-c:a', 'aac', '-b:a', profile.get('audio_bitrate', '128k'), '-ar', str(sample_rate), '-ac', '2',
+             '-movflags', '+faststart']
+    return args
+
+
+def fan_out_filters(video_label, renditions, keep=None):
+    """把一路画面分给多个编码器：split 一次，每个版本各自缩放
+
+    keep 为另外保留的一路（主输出）的标签。返回 (滤镜列表, 每个版本的视频标签)
+    """
+    count = len(renditions) + (1 if keep else 0)
+    labels = [f"[rs{n}]" for n in range(len(renditions))]
+    filters = [f"{video_label}split={count}{keep or ''}{''.join(labels)}"]
+    outputs = []
+    for n, (label, (_, profile)) in enumerate(zip(labels, renditions)):
+        filters.append(f"{label}{scale_filter(profile['size'])}[rv{n}]")
+        outputs.append(f"[rv{n}]")
+    return filters, outputs
+
+
+def render_renditions(source, renditions):
+    """从已合并的主输出生成其他版本：只解码一次，画面分给所有版本的编码器，一次ffmpeg调用完成"""
+    if not renditions:
+        return []
+    filters, outputs = fan_out_filters('[0:v]', renditions)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as script:
+        script.write(';\n'.join(filters))
+        script_path = script.name
+    try:
+        args = ['-i', source, '-filter_complex_script', script_path]
+        for (path, profile), label in zip(renditions, outputs):
+            args += ['-map', label, '-map', '0:a:0?'] + encoder_args(profile) + [path]
+        logging.info(f"生成 {len(renditions)} 个输出版本（解码一次）: "
+                     + ', '.join(profile['name'] for _, profile in renditions))
+        run_ffmpeg(args, "生成输出版本")
+    finally:
+        os.remove(script_path)
+    return [path for path, _ in renditions]
+
+
+def moviepy_fan_out_params(renditions, has_audio=True, preset='medium'):
+    """moviepy write_videofile 的 ffmpeg_params：moviepy 合成的每一帧只传给ffmpeg一次，在ffmpeg中分给所有版本的编码器
+
+    moviepy 的ffmpeg命令中输入0为画面（标准输入），输入1为已编码的音频；这些参数之后的码率等参数属于主输出。
+    """
+    filters, outputs = fan_out_filters('[0:v]', renditions)
+    params = ['-filter_complex', ';'.join(filters)]
+    for (path, profile), label in zip(renditions, outputs):
+        params += ['-map', label] + (['-map', '1:a'] if has_audio else []) + encoder_args(profile) + [path]
+    # 主输出
+    params += ['-map', '0:v', '-c:v', 'libx264', '-preset', preset]
+    if has_audio:
+        params += ['-map', '1:a', '-c:a', 'copy']
+    return params
@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = 'manifest.lock'
+MANIFEST_VERSION = 1
+# 超过这个时间未被使用的片段，以及清单中没有记录的文件（中断留下的临时文件），在保存清单时删除
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha256(path):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _file_lock(path):
+    """跨进程的排他文件锁，多个合并共用同一个片段目录时串行读写清单"""
+    with open(path, 'a+b') as file:
+        if os.name == 'nt':
+            import msvcrt
+            file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约10秒后仍拿不到锁会报错，继续等待
+                    pass
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class SegmentManifest:
+    """记录每个源视频转码后的中间片段，重新合并时只处理新增或修改过的视频
+
+    片段按 源文件内容哈希 + 裁剪 + 目标尺寸 + 编码参数 寻址，
+    文件的 大小/修改时间 未变时直接复用上次计算的哈希。
+    """
+
+    def __init__(self, cache_dir, max_age=DEFAULT_MAX_AGE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_age = max_age
+        self.path = os.path.join(self.cache_dir, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.data = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if data.get('version') == MANIFEST_VERSION:
+                data.setdefault('files', {})
+                data.setdefault('segments', {})
+                return data
+        except (OSError, ValueError):
+            pass
+        return {'version': MANIFEST_VERSION, 'files': {}, 'segments': {}}
+
+    def content_hash(self, path):
+        """获取源文件的内容哈希，文件未变时使用清单中的记录"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            entry = self.data['files'].get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['sha256']
+        sha256 = file_sha256(path)
+        with self._lock:
+            self.data['files'][path] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': sha256}
+        return sha256
+
+    @staticmethod
+    def segment_key(content_hash, **settings):
+        """根据源文件哈希和处理参数生成片段key"""
+        payload = json.dumps({'source': content_hash, 'settings': settings}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def segment_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.mp4')
+
+    def lookup(self, key):
+        """返回已有片段的路径，没有或文件已丢失时返回None"""
+        with self._lock:
+            entry = self.data['segments'].get(key)
+            if entry is None:
+                return None
+            path = self.segment_path(key)
+            if not os.path.exists(path):
+                del self.data['segments'][key]
+                return None
+            entry['used'] = time.time()
+        return path
+
+    def record(self, key, source_hash, source_path=None):
+        """记录新生成的片段"""
+        now = time.time()
+        with self._lock:
+            self.data['segments'][key] = {
+                'source': source_hash,
+                'source_path': source_path,
+                'created': now,
+                'used': now,
+            }
+
+    def prune(self):
+        """删除长时间未使用或文件已丢失的片段、已不存在的源文件记录，以及清单中没有记录的旧文件"""
+        now = time.time()
+        with self._lock:
+            for key, entry in list(self.data['segments'].items()):
+                expired = now - entry.get('used', 0) > self.max_age
+                if expired or not os.path.exists(self.segment_path(key)):
+                    del self.data['segments'][key]
+                if expired:
+                    try:
+                        os.remove(self.segment_path(key))
+                    except OSError:
+                        pass
+            for path in list(self.data['files']):
+                if not os.path.exists(path):
+                    del self.data['files'][path]
+            referenced = {MANIFEST_NAME, LOCK_NAME} | {f'{key}.mp4' for key in self.data['segments']}
+
+        # 转码中断留下的 .part.mp4、写清单中断留下的临时文件等，正在写入的文件修改时间是新的，不会被删除
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                if name not in referenced and os.path.isfile(path) and now - os.path.getmtime(path) > self.max_age:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def _merge(self, data):
+        """合并其他进程写入的清单：同一片段保留最近的使用时间，源文件记录以本进程为准"""
+        with self._lock:
+            for key, entry in data['segments'].items():
+                current = self.data['segments'].get(key)
+                if current is None or current.get('used', 0) < entry.get('used', 0):
+                    self.data['segments'][key] = entry
+            for path, entry in data['files'].items():
+                self.data['files'].setdefault(path, entry)
+
+    def save(self):
+        """合并磁盘上的清单后原子写入
+
+        在文件锁内重新读取清单，保留其他共用该目录的合并在此期间记录的片段，不互相覆盖。
+        """
+        try:
+            with _file_lock(os.path.join(self.cache_dir, LOCK_NAME)):
+                self._merge(self._load())
+                self.prune()
+                with self._lock:
+                    content = json.dumps(self.data, ensure_ascii=False, indent=2)
+                fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+                with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                    file.write(content)
+                os.replace(temp_path, self.path)
+        except OSError as e:
+            logging.warning(f"保存片段清单失败: {str(e)}")
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# 各入口的启动代码：导入模块、命令行 --help、创建Web界面
+ENTRY_POINTS = {
+    'video_merger': ['-c', 'import video_merger'],
+    'video_merger --help': ['video_merger.py', '--help'],
+    'video_downloader': ['-c', 'import video_downloader'],
+    'video_downloader --help': ['video_downloader.py', '--help'],
+    'batch_merge --help': ['batch_merge.py', '--help'],
+    'clip_dedup --help': ['clip_dedup.py', '--help'],
+    'web_ui': ['-c', 'import web_ui'],
+    'web_ui create_ui': ['-c', 'import web_ui; web_ui.create_ui()'],
+}
+# 只应在第一次使用时导入的重量级依赖
+HEAVY_MODULES = ['moviepy', 'numpy', 'yt_dlp', 'fake_useragent', 'browser_cookie3', 'gradio']
+# 与基准相比变慢超过这个比例时视为退化
+REGRESSION_RATIO = 1.2
+REPEAT = 5
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(args, repeat=REPEAT):
+    """多次启动新的Python进程运行入口，返回每次的耗时（秒）"""
+    code = ('import time, sys; start = time.perf_counter()\n'
+            'sys.argv = {argv!r}\n'
+            '{body}\n')
+    if args[0] == '-c':
+        script = code.format(argv=['-c'], body=args[1])
+    else:
+        script = code.format(argv=list(args),
+                             body=f'import runpy\ntry:\n    runpy.run_path({args[0]!r}, run_name="__main__")\n'
+                                  f'except SystemExit:\n    pass')
+    script += ('import json\n'
+               f'print("\\n" + json.dumps({{"seconds": time.perf_counter() - start, '
+               f'"heavy": [m for m in {HEAVY_MODULES!r} if m in sys.modules]}}))\n')
+    times, heavy = [], []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True,
+                                encoding='utf-8', errors='replace')
+        if result.returncode != 0:
+            raise RuntimeError(f"运行失败: {' '.join(args)}\n{result.stderr[-1000:]}")
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        times.append(data['seconds'])
+        heavy = data['heavy']
+    return times, heavy
+
+
+def run(names, repeat=REPEAT):
+    """测量指定入口的启动耗时，返回 {入口: {'median': 秒, 'min': 秒, 'heavy': 已导入的重量级依赖}}"""
+    results = {}
+    for name in names:
+        times, heavy = measure(ENTRY_POINTS[name], repeat)
+        results[name] = {'median': statistics.median(times), 'min': min(times), 'heavy': heavy}
+        print(f"{name:<26} 中位数 {results[name]['median'] * 1000:8.1f} ms  "
+              f"最快 {results[name]['min'] * 1000:8.1f} ms  已导入: {', '.join(heavy) or '-'}")
+    return results
+
+
+def compare(results, baseline):
+    """与基准结果比较，返回变慢超过 REGRESSION_RATIO 的入口"""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median'] / baseline[name]['median']
+        print(f"{name:<26} {baseline[name]['median'] * 1000:8.1f} ms -> {result['median'] * 1000:8.1f} ms "
+              f"({ratio:.2f}x)")
+        if ratio > REGRESSION_RATIO:
+            regressions.append(name)
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='测量各入口的启动耗时（导入依赖的开销）')
+    parser.add_argument('entries', nargs='*', help='要测量的入口，默认全部：' + '、'.join(ENTRY_POINTS))
+    parser.add_argument('-n', '--repeat', type=int, default=REPEAT, help='每个入口运行的次数')
+    parser.add_argument('-o', '--output', help='把结果保存为JSON文件，可作为以后比较的基准')
+    parser.add_argument('-b', '--baseline', help='与之前保存的基准结果比较，变慢超过20%%时返回非零退出码')
+    args = parser.parse_args()
+    unknown = [name for name in args.entries if name not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"未知的入口: {', '.join(unknown)}")
+
+    results = run(args.entries or list(ENTRY_POINTS), args.repeat)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            regressions = compare(results, json.load(file))
+        if regressions:
+            print(f"启动变慢: {', '.join(regressions)}")
+            sys.exit(1)
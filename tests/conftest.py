@@ -0,0 +1,145 @@
+import os
+import sys
+import pytest
+
+# 模块都在仓库根目录下
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ffmpeg_utils import get_ffmpeg_exe, run_ffmpeg  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def ffmpeg():
+    """需要ffmpeg的测试在找不到ffmpeg时跳过"""
+    if not get_ffmpeg_exe():
+        pytest.skip("未找到ffmpeg")
+
+
+def make_clip(path, duration=4.0, source='testsrc2', size=(320, 568), fps=30, gop=None, bframes=3, audio=True):
+    """生成测试用的 H.264/AAC 视频，gop 为关键帧间隔（帧数），bframes 为B帧数量"""
+    args = ['-f', 'lavfi', '-i', f"{source}=size={size[0]}x{size[1]}:rate={fps}"]
+    if audio:
+        args += ['-f', 'lavfi', '-i', 'sine=frequency=440']
+    args += ['-t', str(duration), '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+             '-bf', str(bframes)]
+    if gop:
+        args += ['-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0']
+    if audio:
+        args += ['-c:a', 'aac', '-shortest']
+    run_ffmpeg(args + [str(path)], f"生成测试视频 {os.path.basename(str(path))}")
+    return str(path)
+
+
+class MediaServer:
+    """本地HTTP服务器，代替视频网站提供测试视频：支持Range请求，可以让指定路径先失败几次、返回404或放慢传输
+
+    requests 记录每个请求 (开始时间, 路径, Range头)，max_active 为同时在传输的不同路径数的最大值。
+    """
+
+    def __init__(self, files, chunk_delay=0.0):
+        import threading
+        from http.server import ThreadingHTTPServer
+        self.files = dict(files)
+        self.chunk_delay = chunk_delay
+        self.failures = {}   # 路径 -> [接下来几次请求返回的状态码]
+        self.requests = []
+        self.max_active = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = lambda request, client_address: None  # 客户端提前断开连接时不打印异常
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path, host='127.0.0.1'):
+        return f'http://{host}:{self.httpd.server_port}/{path}'
+
+    def fail(self, path, *statuses):
+        self.failures[path] = list(statuses)
+
+    def requests_for(self, path):
+        return [request for request in self.requests if request[1] == '/' + path]
+
+    def _enter(self, path):
+        with self._lock:
+            self._active[path] = self._active.get(path, 0) + 1
+            self.max_active = max(self.max_active, len(self._active))
+
+    def _leave(self, path):
+        with self._lock:
+            self._active[path] -= 1
+            if not self._active[path]:
+                del self._active[path]
+
+    def _handler(self):
+        import re
+        import time
+        from http.server import BaseHTTPRequestHandler
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                name = path.lstrip('/')
+                with server._lock:
+                    server.requests.append((time.monotonic(), path, self.headers.get('Range')))
+                    scripted = server.failures.get(name)
+                    status = scripted.pop(0) if scripted else None
+                if name not in server.files:
+                    status = 404
+                if status:
+                    self.send_response(status)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+
+                data = server.files[name]
+                start = 0
+                match = re.match(r'bytes=(\d+)-', self.headers.get('Range') or '')
+                if match and int(match.group(1)) < len(data):
+                    start = int(match.group(1))
+                    self.send_response(206)
+                    self.send_header('Content-Range', f'bytes {start}-{len(data) - 1}/{len(data)}')
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Accept-Ranges', 'bytes')
+                self.send_header('Content-Length', str(len(data) - start))
+                self.end_headers()
+                server._enter(path)
+                try:
+                    for offset in range(start, len(data), 8192):
+                        self.wfile.write(data[offset:offset + 8192])
+                        if server.chunk_delay:
+                            time.sleep(server.chunk_delay)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    server._leave(path)
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(scope='session')
+def fixture_media(ffmpeg, tmp_path_factory):
+    """几个很小的测试视频 {文件名: 内容}"""
+    directory = tmp_path_factory.mktemp('media')
+    media = {}
+    for n, source in enumerate(['testsrc2', 'mandelbrot', 'smptebars', 'rgbtestsrc'], 1):
+        path = make_clip(directory / f'clip{n}.mp4', 2.0, source=source, size=(160, 284), fps=15)
+        with open(path, 'rb') as file:
+            media[f'clip{n}.mp4'] = file.read()
+    return media
@@ -0,0 +1,29 @@
+import pytest
+from conftest import make_clip
+from clip_dedup import sample_frames, find_duplicates, SAMPLE_COUNT, HASH_SIZE
+from ffmpeg_utils import run_ffmpeg
+
+FRAME_SIZE = (HASH_SIZE + 1) * HASH_SIZE
+
+
+@pytest.mark.parametrize('duration, fps, gop, bframes', [
+    (4.0, '30', None, 3),          # 默认关键帧间隔，B帧
+    (7.3, '30', 37, 3),            # 关键帧与截取点不对齐
+    (10.0, '30000/1001', 250, 2),
+    (5.0, '25', 12, 0),
+])
+def test_sample_frames_returns_one_frame_per_sample_point(ffmpeg, tmp_path, duration, fps, gop, bframes):
+    path = make_clip(tmp_path / 'clip.mp4', duration, fps=fps, gop=gop, bframes=bframes)
+    data = sample_frames(path, duration)
+    assert len(data) == SAMPLE_COUNT * FRAME_SIZE
+
+
+def test_find_duplicates_groups_reencoded_copy(ffmpeg, tmp_path):
+    original = make_clip(tmp_path / 'a.mp4', 4.0, source='testsrc2')
+    other = make_clip(tmp_path / 'b.mp4', 4.0, source='mandelbrot')
+    repost = str(tmp_path / 'a_repost.mp4')
+    run_ffmpeg(['-i', original, '-vf', 'scale=180:320', '-c:v', 'libx264', '-crf', '32', '-bf', '0',
+                '-c:a', 'aac', repost], "重新编码测试视频")
+
+    groups = find_duplicates([original, other, repost], [4.0, 4.0, 4.0])
+    assert groups == [[0, 2]]
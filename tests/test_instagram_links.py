@@ -0,0 +1,53 @@
+import pytest
+from instagram_links import canonicalize_link, iter_instagram_links
+from download_archive import archive_key
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('https://www.instagram.com/reel/Cabc123_-x/', ('reel', 'Cabc123_-x')),
+    ('https://www.instagram.com/reels/Cabc123_-x/', ('reel', 'Cabc123_-x')),
+    ('https://www.instagram.com/p/Cabc123_-x/?igsh=MWQ1ZGUxMzBkMA==', ('p', 'Cabc123_-x')),
+    ('https://instagram.com/tv/Cabc123_-x?utm_source=ig_web_copy_link', ('tv', 'Cabc123_-x')),
+    ('https://www.instagram.com/some.user_1/reel/Cabc123_-x/', ('reel', 'Cabc123_-x')),
+    ('https://www.instagram.com/stories/some.user_1/3141592653589793/', ('stories', 'some.user_1/3141592653589793')),
+    ('https://www.instagram.com/share/reel/BAabc123xyz/', ('share', '/share/reel/BAabc123xyz')),
+    ('https://www.instagram.com/share/BAabc123xyz/?igsh=abc', ('share', '/share/BAabc123xyz')),
+    ('https://www.instagram.com/explore/tags/cats/', ('link', '/explore/tags/cats')),
+])
+def test_canonicalize_link(url, expected):
+    assert canonicalize_link(url) == expected
+
+
+def test_tracking_parameters_and_post_kinds_collapse_to_one_link():
+    text = '\n'.join([
+        'https://www.instagram.com/reel/Cabc123/?igsh=MWQ1ZGUxMzBkMA==',
+        '看这个 https://www.instagram.com/p/Cabc123/?utm_source=ig_web_copy_link。',
+        'https://www.instagram.com/reels/Cabc123/ https://www.instagram.com/some.user/reel/Cabc123/',
+        'https://www.instagram.com/tv/Cxyz789/',
+    ])
+    assert [url for _, _, url in iter_instagram_links(text)] == [
+        'https://www.instagram.com/reel/Cabc123/',
+        'https://www.instagram.com/tv/Cxyz789/',
+    ]
+
+
+def test_stories_keep_user_and_id():
+    links = list(iter_instagram_links('https://www.instagram.com/stories/some.user/3141592653589793/?hl=en'))
+    assert links == [('stories', 'some.user/3141592653589793',
+                      'https://www.instagram.com/stories/some.user/3141592653589793/')]
+
+
+def test_share_links_keep_original_url():
+    share = 'https://www.instagram.com/share/reel/BAabc123xyz/?igsh=abc'
+    links = list(iter_instagram_links(f'{share}, https://www.instagram.com/share/reel/BAabc123xyz/'))
+    assert [url for _, _, url in links] == [share]
+
+
+def test_archive_key():
+    assert archive_key('https://www.instagram.com/p/Cabc123/?igsh=x') == \
+        archive_key('https://www.instagram.com/reel/Cabc123/') == 'instagram:Cabc123'
+    # 分享令牌不是短代码，按完整路径记录
+    assert archive_key('https://www.instagram.com/share/reel/BAabc123xyz/?igsh=x') == \
+        'url:www.instagram.com/share/reel/BAabc123xyz'
+    assert archive_key('https://www.instagram.com/share/reel/BAabc123xyz/') != archive_key(
+        'https://www.instagram.com/reel/BAabc123xyz/')
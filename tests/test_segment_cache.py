@@ -0,0 +1,53 @@
+import os
+import time
+import pytest
+from conftest import make_clip
+from segment_cache import SegmentManifest
+from video_merger import _merge_normalized, probe_videos
+
+
+def _add_segment(manifest, key, source):
+    with open(manifest.segment_path(key), 'wb') as file:
+        file.write(b'segment')
+    manifest.record(key, source)
+
+
+def test_concurrent_saves_keep_each_others_segments(tmp_path):
+    first, second = SegmentManifest(tmp_path), SegmentManifest(tmp_path)
+    _add_segment(first, 'a' * 64, 'source-a')
+    _add_segment(second, 'b' * 64, 'source-b')
+    first.save()
+    second.save()
+    first.save()
+
+    assert set(SegmentManifest(tmp_path).data['segments']) == {'a' * 64, 'b' * 64}
+
+
+def test_prune_sweeps_old_unreferenced_files(tmp_path):
+    manifest = SegmentManifest(tmp_path, max_age=3600)
+    _add_segment(manifest, 'a' * 64, 'source-a')
+    old = time.time() - 7200
+    stale_part = tmp_path / f"{'c' * 64}.1234abcd.part.mp4"
+    stale_part.write_bytes(b'part')
+    os.utime(stale_part, (old, old))
+    active_part = tmp_path / f"{'d' * 64}.5678abcd.part.mp4"
+    active_part.write_bytes(b'part')
+    os.utime(manifest.segment_path('a' * 64), (old, old))  # 清单中有记录的片段按使用时间判断
+    manifest.save()
+
+    assert not stale_part.exists()
+    assert active_part.exists()
+    assert os.path.exists(manifest.segment_path('a' * 64))
+
+
+def test_failed_merge_leaves_no_part_files(ffmpeg, tmp_path):
+    bad = tmp_path / 'bad.mp4'
+    bad.write_bytes(b'not a video')
+    good = make_clip(tmp_path / 'good.mp4', 1.0)
+    infos = [{'duration': 1.0, 'acodec': 'aac'}] + probe_videos([good])
+    manifest = SegmentManifest(tmp_path / '.merge_cache')
+
+    with pytest.raises(RuntimeError):
+        _merge_normalized([str(bad), good], infos, str(tmp_path / 'final.mp4'), "", "", 'p6', workers=1,
+                          size=(320, 568), manifest=manifest)
+    assert not list((tmp_path / '.merge_cache').glob('*.part.mp4'))
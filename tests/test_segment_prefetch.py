@@ -0,0 +1,38 @@
+import os
+import logging
+from conftest import make_clip
+from video_merger import SegmentPrefetcher, merge_videos
+
+
+def _segments(cache_dir):
+    return {name: os.stat(os.path.join(cache_dir, name)).st_mtime_ns
+            for name in os.listdir(cache_dir) if name.endswith('.mp4')}
+
+
+def test_prefetched_segments_reused_by_merge(ffmpeg, tmp_path, caplog):
+    input_dir = tmp_path / 'videos'
+    input_dir.mkdir()
+    clips = [make_clip(input_dir / f'clip{n}.mp4', 2.0, source=source)
+             for n, source in enumerate(('testsrc2', 'mandelbrot'), 1)]
+    output_path = str(tmp_path / 'final.mp4')
+
+    with SegmentPrefetcher(output_path, workers=2) as prefetcher:
+        assert all(prefetcher.submit(clip) for clip in clips)
+        prefetcher.wait()
+    cache_dir = str(tmp_path / '.merge_cache')
+    prefetched = _segments(cache_dir)
+    assert len(prefetched) == 2
+
+    with caplog.at_level(logging.INFO):
+        merge_videos(str(input_dir), output_path, workers=2, use_cache=False)
+    assert "复用 2 个未变化视频的已转码片段" in caplog.text
+    assert _segments(cache_dir) == prefetched
+    assert os.path.getsize(output_path) > 0
+
+
+def test_stream_copy_ready_clip_not_prefetched(ffmpeg, tmp_path):
+    clip = make_clip(tmp_path / 'ready.mp4', 1.0, size=(720, 1280))
+    with SegmentPrefetcher(str(tmp_path / 'final.mp4'), workers=1) as prefetcher:
+        assert not prefetcher.submit(clip)
+        prefetcher.wait()
+    assert not list(tmp_path.glob('.merge_cache/*.mp4'))
@@ -0,0 +1,46 @@
+import pytest
+from trim_planner import plan_trim, encoded_seconds, DEFAULT_SNAP
+
+# 每2秒一个关键帧的10秒视频
+KEYFRAMES = [0.0, 2.0, 4.0, 6.0, 8.0]
+DURATION = 10.0
+
+
+@pytest.mark.parametrize('start, end, snap, expected', [
+    # 起点正好在关键帧上
+    (2.0, 6.0, 0.0, [('copy', 2.0, 6.0)]),
+    (2.03, 6.0, 0.0, [('copy', 2.0, 6.0)]),
+    (2.0, 7.0, 0.0, [('copy', 2.0, 6.0), ('encode', 6.0, 7.0)]),
+    # 起点和终点之间没有关键帧
+    (2.5, 3.5, 0.0, [('encode', 2.5, 3.5)]),
+    (2.5, 3.98, 0.0, [('encode', 2.5, 3.98)]),
+    (1.0, 5.0, 0.0, [('encode', 1.0, 2.0), ('copy', 2.0, 4.0), ('encode', 4.0, 5.0)]),
+    # 终点提前不超过 snap 秒对齐到关键帧
+    (0.0, 6.25, DEFAULT_SNAP, [('copy', 0.0, 6.0)]),
+    (0.0, 6.3, DEFAULT_SNAP, [('copy', 0.0, 6.0)]),
+    (0.0, 6.4, DEFAULT_SNAP, [('copy', 0.0, 6.0), ('encode', 6.0, 6.4)]),
+    (0.0, 6.25, 0.0, [('copy', 0.0, 6.0), ('encode', 6.0, 6.25)]),
+    # 起点为0
+    (0.0, DURATION, 0.0, [('copy', 0.0, DURATION)]),
+    (0.0, 9.5, DEFAULT_SNAP, [('copy', 0.0, 8.0), ('encode', 8.0, 9.5)]),
+    (0.0, 1.5, 0.0, [('encode', 0.0, 1.5)]),
+    # 终点超过视频时长
+    (4.0, 12.0, 0.0, [('copy', 4.0, 12.0)]),
+    (3.0, 12.0, 0.0, [('encode', 3.0, 4.0), ('copy', 4.0, 12.0)]),
+    (8.5, 12.0, 0.0, [('encode', 8.5, 12.0)]),
+])
+def test_plan_trim(start, end, snap, expected):
+    assert plan_trim(KEYFRAMES, start, end, DURATION, snap=snap) == expected
+
+
+def test_plan_trim_without_keyframes_encodes_everything():
+    assert plan_trim([], 1.0, 5.0, DURATION) == [('encode', 1.0, 5.0)]
+    assert plan_trim(None, 0.0, DURATION, DURATION) == [('encode', 0.0, DURATION)]
+
+
+def test_plan_trim_ignores_keyframe_order():
+    assert plan_trim(list(reversed(KEYFRAMES)), 1.0, 5.0, DURATION) == plan_trim(KEYFRAMES, 1.0, 5.0, DURATION)
+
+
+def test_encoded_seconds():
+    assert encoded_seconds(plan_trim(KEYFRAMES, 1.0, 5.0, DURATION)) == pytest.approx(2.0)
@@ -0,0 +1,102 @@
+import os
+import json
+import pytest
+import video_downloader
+from conftest import MediaServer
+from rate_limiter import HostRateLimiter
+from video_downloader import download_videos, REPORT_NAME
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """yt-dlp把cookies.txt写在当前目录"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def first_request_times(server, paths):
+    return [server.requests_for(path)[0][0] for path in paths]
+
+
+def test_downloads_overlap_up_to_concurrency(workdir, fixture_media):
+    with MediaServer(fixture_media, chunk_delay=0.1) as server:
+        links = [server.url(name) for name in fixture_media]
+        failed = download_videos(links, str(workdir / 'out'), concurrency=3, use_archive=False,
+                                 limiter=HostRateLimiter(rate=100, burst=10, jitter=0))
+    assert failed == []
+    assert 2 <= server.max_active <= 3
+    assert sorted(os.listdir(workdir / 'out')) == sorted(f'clip{n}NA.mp4' for n in range(1, 5)) + \
+        ['download_report.json']
+
+
+def test_single_download_at_a_time(workdir, fixture_media):
+    with MediaServer(fixture_media, chunk_delay=0.05) as server:
+        links = [server.url(name) for name in list(fixture_media)[:3]]
+        failed = download_videos(links, str(workdir / 'out'), concurrency=1, use_archive=False,
+                                 limiter=HostRateLimiter(rate=100, burst=10, jitter=0))
+    assert failed == []
+    assert server.max_active == 1
+
+
+def test_requests_to_one_host_are_paced(workdir, fixture_media):
+    names = list(fixture_media)
+    with MediaServer(fixture_media) as server:
+        # 先下载一次，让yt-dlp完成第一次匹配链接时的初始化，之后的请求时间只受限速器控制
+        download_videos([server.url(names[0], host='localhost')], str(workdir / 'warmup'), use_archive=False,
+                        limiter=HostRateLimiter(jitter=0))
+        server.requests.clear()
+        # 三个链接在同一个域名，一个在另一个域名（localhost），令牌桶按域名分开
+        links = [server.url(name) for name in names[:3]] + [server.url(names[3], host='localhost')]
+        failed = download_videos(links, str(workdir / 'out'), concurrency=4, use_archive=False,
+                                 limiter=HostRateLimiter(rate=2, burst=1, jitter=0))
+    assert failed == []
+    # 每秒2个请求，间隔0.5秒（留出发出请求前的处理时间）
+    paced = sorted(first_request_times(server, names[:3]))
+    assert all(later - earlier >= 0.3 for earlier, later in zip(paced, paced[1:]))
+    other_host = first_request_times(server, names[3:])[0]
+    assert other_host - paced[0] < 0.3
+
+
+def test_partial_download_resumes_with_range_request(workdir, fixture_media):
+    data = fixture_media['clip1.mp4']
+    out = workdir / 'out'
+    out.mkdir()
+    half = len(data) // 2
+    (out / 'clip1NA.mp4.part').write_bytes(data[:half])
+    with MediaServer(fixture_media) as server:
+        failed = download_videos([server.url('clip1.mp4')], str(out), use_archive=False,
+                                 limiter=HostRateLimiter(jitter=0))
+    assert failed == []
+    assert f'bytes={half}-' in [request[2] for request in server.requests_for('clip1.mp4')]
+    assert (out / 'clip1NA.mp4').read_bytes() == data
+
+
+def test_failed_link_is_requeued_behind_the_batch(workdir, fixture_media, monkeypatch):
+    monkeypatch.setattr(video_downloader, 'RETRY_BASE_DELAY', 0.3)
+    monkeypatch.setattr(video_downloader, 'FAILURE_PENALTY', 0)
+    with MediaServer(fixture_media) as server:
+        server.fail('clip1.mp4', 503)
+        links = [server.url(name) for name in ['clip1.mp4', 'clip2.mp4', 'clip3.mp4']]
+        failed = download_videos(links, str(workdir / 'out'), concurrency=1, use_archive=False,
+                                 limiter=HostRateLimiter(rate=100, burst=10, jitter=0))
+    assert failed == []
+    # 第一次失败后其他链接先下载，等待退避时间后再重试
+    retried = server.requests_for('clip1.mp4')[1][0]
+    assert all(request[0] < retried for name in ['clip2.mp4', 'clip3.mp4'] for request in server.requests_for(name))
+    assert retried - server.requests_for('clip1.mp4')[0][0] >= 0.3 * 0.8
+    report = json.loads((workdir / 'out' / REPORT_NAME).read_text(encoding='utf-8'))
+    assert report['succeeded'] == 3 and report['failed'] == []
+
+
+def test_permanent_404_is_reported_without_retry(workdir, fixture_media, monkeypatch):
+    monkeypatch.setattr(video_downloader, 'FAILURE_PENALTY', 0)
+    with MediaServer(fixture_media) as server:
+        missing = server.url('deleted.mp4')
+        failed = download_videos([server.url('clip1.mp4'), missing], str(workdir / 'out'), use_archive=False,
+                                 limiter=HostRateLimiter(rate=100, burst=10, jitter=0))
+    assert failed == [missing]
+    assert len(server.requests_for('deleted.mp4')) == 1
+    report = json.loads((workdir / 'out' / REPORT_NAME).read_text(encoding='utf-8'))
+    assert report['total'] == 2 and report['succeeded'] == 1
+    assert [(item['link'], item['attempts']) for item in report['failed']] == [(missing, 1)]
+    assert 'HTTP Error 404' in report['failed'][0]['error']
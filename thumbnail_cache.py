@@ -0,0 +1,109 @@
+import os
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from ffmpeg_utils import run_ffmpeg
+from transition_cache import TransitionCache
+
+# 默认缓存目录和容量上限
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'insGenerate', 'thumbnails')
+DEFAULT_MAX_BYTES = 500 * 1024 * 1024
+THUMBNAIL_VERSION = 1
+
+# 封面图和预览片段参数
+POSTER_WIDTH = 360
+POSTER_TIME = 1.0
+PREVIEW_WIDTH = 240
+PREVIEW_SECONDS = 3
+PREVIEW_FPS = 15
+PREVIEW_BITRATE = '300k'
+# 同时运行的ffmpeg进程数
+THUMBNAIL_WORKERS = 4
+
+
+class ThumbnailCache:
+    """视频封面图和低码率预览片段的磁盘缓存，按 路径 + 大小 + 修改时间 寻址
+
+    gallery只加载几十KB的封面图，选中视频时才加载几秒的预览片段，加载时间与源文件大小无关。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        cache_dir = cache_dir or os.environ.get('THUMBNAIL_CACHE_DIR') or DEFAULT_CACHE_DIR
+        self.posters = TransitionCache(cache_dir, max_bytes // 5, suffix='.jpg')
+        self.previews = TransitionCache(cache_dir, max_bytes - max_bytes // 5, suffix='.mp4')
+        self.cache_dir = self.posters.cache_dir
+
+    @staticmethod
+    def make_key(path, kind):
+        """根据源文件路径、大小、修改时间生成缓存key，文件不存在时返回None"""
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return TransitionCache.make_key(path=path, size=stat.st_size, mtime=stat.st_mtime,
+                                        kind=kind, version=THUMBNAIL_VERSION)
+
+    def _build(self, cache, key, suffix, args, description):
+        """用ffmpeg生成文件并存入缓存，失败时返回None"""
+        fd, temp_path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        try:
+            run_ffmpeg(args + [temp_path], description)
+            return cache.put(key, temp_path)
+        except RuntimeError as e:
+            logging.warning(str(e))
+            return None
+        finally:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def poster(self, path, duration=None):
+        """获取视频封面图（JPEG），没有缓存时截取一帧"""
+        key = self.make_key(path, 'poster')
+        if key is None:
+            return None
+        cached = self.posters.get(key)
+        if cached:
+            return cached
+        # 跳过开头可能的黑场，短视频取中间
+        position = POSTER_TIME if not duration else min(POSTER_TIME, duration / 2)
+        args = ['-ss', f'{position:.3f}', '-i', path, '-frames:v', '1',
+                '-vf', f'scale={POSTER_WIDTH}:-2', '-q:v', '4']
+        return self._build(self.posters, key, '.jpg', args, f"生成封面 {os.path.basename(path)}")
+
+    def preview(self, path):
+        """获取视频开头几秒的低码率预览片段，没有缓存时生成"""
+        key = self.make_key(path, 'preview')
+        if key is None:
+            return None
+        cached = self.previews.get(key)
+        if cached:
+            return cached
+        args = ['-t', str(PREVIEW_SECONDS), '-i', path,
+                '-map', '0:v:0', '-map', '0:a:0?',
+                '-vf', f'scale={PREVIEW_WIDTH}:-2,fps={PREVIEW_FPS}',
+                '-c:v', 'libx264', '-preset', 'veryfast', '-b:v', PREVIEW_BITRATE, '-pix_fmt', 'yuv420p',
+                '-c:a', 'aac', '-b:a', '64k', '-ac', '1', '-movflags', '+faststart']
+        return self._build(self.previews, key, '.mp4', args, f"生成预览 {os.path.basename(path)}")
+
+    def build_many(self, paths, durations=None):
+        """并行获取多个视频的 (封面图, 预览片段)，顺序与输入一致，失败的项为None"""
+        durations = durations or [None] * len(paths)
+        with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as pool:
+            posters = [pool.submit(self.poster, path, duration) for path, duration in zip(paths, durations)]
+            previews = [pool.submit(self.preview, path) for path in paths]
+            return [(poster.result(), preview.result()) for poster, preview in zip(posters, previews)]
+
+
+_cache = None
+
+
+def get_thumbnail_cache():
+    """获取进程内共享的缩略图缓存"""
+    global _cache
+    if _cache is None:
+        _cache = ThumbnailCache()
+    return _cache
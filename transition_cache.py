@@ -0,0 +1,91 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+
+# 默认缓存目录和容量上限
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'insGenerate', 'transitions')
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class TransitionCache:
+    """已编码过渡片段的磁盘缓存，按参数哈希寻址，超过容量时按最近使用时间淘汰"""
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, suffix='.mp4'):
+        self.cache_dir = os.path.abspath(cache_dir or os.environ.get('TRANSITION_CACHE_DIR') or DEFAULT_CACHE_DIR)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(**fields):
+        """根据过渡画面参数生成缓存key"""
+        payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + self.suffix)
+
+    def get(self, key):
+        """返回缓存文件路径，未命中返回None"""
+        path = self._path(key)
+        try:
+            os.utime(path)  # 刷新使用时间，用于LRU淘汰
+        except OSError:
+            return None
+        return path
+
+    def fetch(self, key, dest_path):
+        """命中时把缓存片段链接（或复制）到目标路径，返回是否命中"""
+        path = self.get(key)
+        if path is None:
+            return False
+        try:
+            try:
+                os.link(path, dest_path)
+            except OSError:
+                shutil.copy2(path, dest_path)
+        except OSError as e:
+            logging.debug(f"读取缓存失败 {key}: {str(e)}")
+            return False
+        return True
+
+    def put(self, key, source_path):
+        """把编码好的片段存入缓存"""
+        try:
+            fd, temp_path = tempfile.mkstemp(suffix=self.suffix + '.tmp', dir=self.cache_dir)
+            os.close(fd)
+            shutil.copyfile(source_path, temp_path)
+            os.replace(temp_path, self._path(key))  # 原子替换，避免并发写入时读到半个文件
+        except OSError as e:
+            logging.debug(f"写入缓存失败 {key}: {str(e)}")
+            return None
+        self.evict()
+        return self._path(key)
+
+    def evict(self):
+        """删除最久未使用的文件，直到总大小不超过上限"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.suffix):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
@@ -0,0 +1,64 @@
+import bisect
+
+# 时间点与关键帧相差不超过这个值（秒）时视为在关键帧上
+KEYFRAME_TOLERANCE = 0.05
+# 默认去掉结尾0.5秒时，终点可以提前这么多秒对齐到关键帧，整段都能流复制
+DEFAULT_SNAP = 0.3
+
+
+def plan_trim(keyframes, start, end, duration, snap=0.0, tolerance=KEYFRAME_TOLERANCE):
+    """规划剪辑 [start, end) 的处理方式，返回 [(方式, 起点, 终点)]，方式为 'copy'（流复制）或 'encode'（重新编码）
+
+    起点不在关键帧上时重新编码到下一个关键帧；终点不在关键帧上时流复制到终点前的最后一个关键帧，
+    只重新编码最后不完整的一段GOP。snap 大于0时终点可以提前最多 snap 秒对齐到关键帧，不需要重新编码。
+    没有关键帧信息时整段重新编码。
+    """
+    keyframes = sorted(keyframes or [])
+    if not keyframes:
+        return [('encode', start, end)]
+
+    def keyframe_near(time):
+        index = bisect.bisect_left(keyframes, time - tolerance)
+        if index < len(keyframes) and abs(keyframes[index] - time) <= tolerance:
+            return keyframes[index]
+        return None
+
+    plan = []
+    copy_start = keyframe_near(start)
+    if copy_start is None:
+        # 起点之后的第一个关键帧
+        index = bisect.bisect_right(keyframes, start)
+        if index == len(keyframes) or keyframes[index] >= end - tolerance:
+            return [('encode', start, end)]
+        copy_start = keyframes[index]
+        plan.append(('encode', start, copy_start))
+
+    if end >= duration - tolerance or keyframe_near(end) is not None:
+        plan.append(('copy', copy_start, end))
+        return plan
+    # 终点之前的最后一个关键帧
+    index = bisect.bisect_left(keyframes, end) - 1
+    copy_end = keyframes[index]
+    if copy_end <= copy_start + tolerance:
+        plan.append(('encode', copy_start, end))
+    elif end - copy_end <= snap:
+        plan.append(('copy', copy_start, copy_end))
+    else:
+        plan += [('copy', copy_start, copy_end), ('encode', copy_end, end)]
+    return _merge_adjacent(plan)
+
+
+def _merge_adjacent(plan):
+    """合并相邻的同类段"""
+    merged = []
+    for mode, start, end in plan:
+        if merged and merged[-1][0] == mode:
+            merged[-1] = (mode, merged[-1][1], end)
+        else:
+            merged.append((mode, start, end))
+    return merged
+
+
+def encoded_seconds(plan):
+    """计划中需要重新编码的总时长（秒）"""
+    return sum(end - start for mode, start, end in plan if mode == 'encode')
@@ -1,38 +1,68 @@
-import re
 from datetime import datetime
-import yt_dlp
 import os
 import csv
 import time
 import random
 import shutil
 import json
-from fake_useragent import UserAgent
-import browser_cookie3
+import argparse
+import itertools
+import heapq
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from rate_limiter import HostRateLimiter, DEFAULT_RATE
+from download_archive import DownloadArchive, archive_key
+from instagram_links import iter_instagram_links
+# yt_dlp、fake_useragent、browser_cookie3 导入较慢，在第一次使用时才导入
 
-def get_random_delay():
-    """生成随机延迟时间"""
-    # 生成2-5秒的随机延迟
-    return random.uniform(2, 5)
+# 同时进行的下载数
+DEFAULT_CONCURRENCY = 3
+# 下载失败后该域名暂停的秒数
+FAILURE_PENALTY = 5
+# 每个链接最多尝试的次数，以及重试的等待时间（指数增长：5秒、10秒、20秒...，最多60秒）
+MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 5
+RETRY_MAX_DELAY = 60
+# 整个批次的重试次数上限（占链接数的比例，至少5次），大量失败时不会无限重试
+RETRY_BUDGET_RATIO = 0.5
+REPORT_NAME = 'download_report.json'
+# 重试也不会成功的错误（视频已删除、链接不受支持），不再重新排队
+PERMANENT_ERRORS = ('HTTP Error 404', 'HTTP Error 410', 'Unsupported URL')
+# 预加载的User-Agent数量
+USER_AGENT_POOL_SIZE = 20
+# fake_useragent失败时使用的预定义User-Agent列表
+FALLBACK_USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.59'
+]
+
+_user_agents = None
+_user_agents_lock = threading.Lock()
+
+def load_user_agents(count=USER_AGENT_POOL_SIZE):
+    """生成User-Agent轮换列表，fake_useragent的数据集每个进程只加载一次"""
+    global _user_agents
+    with _user_agents_lock:
+        if _user_agents is None:
+            try:
+                from fake_useragent import UserAgent
+                ua = UserAgent()
+                agents = list(dict.fromkeys(ua.random for _ in range(count)))
+            except Exception:
+                agents = []
+            _user_agents = agents or list(FALLBACK_USER_AGENTS)
+    return _user_agents
 
 def get_random_user_agent():
     """获取随机User-Agent"""
-    try:
-        ua = UserAgent()
-        return ua.random
-    except:
-        # 如果fake_useragent失败，使用预定义的User-Agent列表
-        user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.59'
-        ]
-        return random.choice(user_agents)
+    return random.choice(load_user_agents())
 
 def get_instagram_cookies():
     """获取浏览器中的Instagram cookies"""
     try:
+        import browser_cookie3
         # 尝试从多个浏览器获取cookies
         browsers = [
             ('chrome', browser_cookie3.chrome),
@@ -55,19 +85,9 @@ def get_instagram_cookies():
         return None
 
 def extract_instagram_links(file_path: str) -> list:
-    """从文件或文本中提取Instagram链接"""
+    """从文件或文本中提取Instagram链接（已规范化并去重，保持原有顺序）"""
     try:
-        # 如果是文件路径，读取文件内容
-        if os.path.isfile(file_path):
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-        else:
-            # 如果不是文件，直接使用输入的文本
-            content = file_path
-        
-        # 匹配 Instagram 链接的正则表达式，包括查询参数
-        pattern = r'https?://(?:www\.)?instagram\.com/reel/[^/\s]+/?\?[^\s"\')]+|https?://(?:www\.)?instagram\.com/p/[^/\s]+/?\?[^\s"\')]+|https?://(?:www\.)?instagram\.com/reels/[^/\s]+/?\?[^\s"\')]+|https?://(?:www\.)?instagram\.com/stories/[^/\s]+/?\?[^\s"\')]+|https?://(?:www\.)?instagram\.com/tv/[^/\s]+/?\?[^\s"\')]+|https?://(?:www\.)?instagram\.com/[^/\s]+/[^/\s]+/?\?[^\s"\')]+|https?://(?:www\.)?instagram\.com/[^/\s]+/?\?[^\s"\')]+|https?://(?:www\.)?instagram\.com/[^/\s]+/[^/\s]+/?'
-        links = re.findall(pattern, content)
+        links = [url for _, _, url in iter_instagram_links(file_path)]
         
         if links:
             print(f"找到 {len(links)} 个链接:")
@@ -79,19 +99,22 @@ def extract_instagram_links(file_path: str) -> list:
         print(f"提取链接时出错: {str(e)}")
         return []
 
-def download_videos(links, output_path='downloads'):
-    """下载视频"""
-    if not os.path.exists(output_path):
-        os.makedirs(output_path)
-    timestamp = time.time()
-    # 下载配置
-    ydl_opts = {
+def build_ydl_options(output_path='downloads', cookiefile='cookies.txt'):
+    """生成yt-dlp下载配置"""
+    return {
         'format': 'best',
         'outtmpl': os.path.join(output_path, '%(title)s%(timestamp)s.%(ext)s'),
-        'ignoreerrors': True,
+        'ignoreerrors': False,  # 出错时抛出异常，由批次调度器记录原因并安排重试
         'quiet': False,
         'no_warnings': False,
-        'cookiefile': 'cookies.txt',  # 使用cookies文件
+        'cookiefile': cookiefile,  # 使用cookies文件
+        # 中断的下载保留 .part 文件，下次通过HTTP Range从断点继续
+        'continuedl': True,
+        'nopart': False,
+        # 连接中断时在同一次下载内快速重试几次，更长的等待由批次调度器负责
+        'retries': 3,
+        'fragment_retries': 3,
+        'retry_sleep_functions': {'http': lambda n: min(2 ** n, 10), 'fragment': lambda n: min(2 ** n, 10)},
         'http_headers': {
             'User-Agent': get_random_user_agent(),
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
@@ -103,45 +126,244 @@ def download_videos(links, output_path='downloads'):
         }
     }
 
-    for i, link in enumerate(links, 1):
+def _downloaded_files(info):
+    """从yt-dlp返回的信息中取出下载的文件路径"""
+    if not info:
+        return []
+    if info.get('entries') is not None:
+        return [path for entry in info['entries'] for path in _downloaded_files(entry)]
+    return [download['filepath'] for download in info.get('requested_downloads', []) if download.get('filepath')]
+
+class DownloadSession:
+    """下载会话：整个批次只加载一次cookie，每个下载线程复用一个 YoutubeDL 实例（保持HTTP连接），
+    User-Agent 从预加载的列表中轮换"""
+
+    def __init__(self, output_path='downloads', cookiefile='cookies.txt'):
+        self.options = build_ydl_options(output_path, cookiefile)
+        agents = load_user_agents()
+        self._agents = itertools.cycle(random.sample(agents, len(agents)))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._instances = []
+        self._cookiejar = None
+
+    def _get_ydl(self):
+        """获取当前线程的 YoutubeDL 实例，第一次调用时创建"""
+        ydl = getattr(self._local, 'ydl', None)
+        if ydl is None:
+            import yt_dlp
+            ydl = yt_dlp.YoutubeDL(dict(self.options, http_headers=dict(self.options['http_headers'])))
+            with self._lock:
+                if self._cookiejar is None:
+                    self._cookiejar = ydl.cookiejar  # 读取一次cookies文件
+                else:
+                    ydl.cookiejar = self._cookiejar  # 其他实例共享同一个cookie jar
+                self._instances.append(ydl)
+            self._local.ydl = ydl
+        return ydl
+
+    def prepare(self):
+        """提前创建当前线程的 YoutubeDL 实例（第一次需要导入yt_dlp），限速器放行后立即发出请求"""
+        self._get_ydl()
+
+    def next_user_agent(self):
+        with self._lock:
+            return next(self._agents)
+
+    def download(self, link):
+        """下载单个链接，返回下载得到的文件列表（多视频帖子会有多个文件），失败时返回空列表"""
+        ydl = self._get_ydl()
+        ydl.params['http_headers']['User-Agent'] = self.next_user_agent()
+        info = ydl.extract_info(link, download=True)
+        return [path for path in _downloaded_files(info) if os.path.exists(path)]
+
+    def close(self):
+        """关闭所有实例（保存cookies，关闭连接）"""
+        with self._lock:
+            instances, self._instances = self._instances, []
+        for ydl in instances:
+            try:
+                ydl.close()
+            except Exception as e:
+                print(f"关闭下载会话时出错: {str(e)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def download_videos(links, output_path='downloads', progress=None, concurrency=DEFAULT_CONCURRENCY, limiter=None,
+                    session=None, use_archive=True, max_attempts=MAX_ATTEMPTS, on_complete=None):
+    """并发下载视频，返回下载失败的链接
+
+    concurrency 为同时进行的下载数；请求节奏由 limiter（按域名的令牌桶限速器）控制，
+    同一域名的请求保持礼貌的速率，不同下载的网络传输相互重叠。
+    session 为下载会话，不提供时为本批次创建一个，批次结束后关闭。
+    失败的链接放回队列末尾，按指数退避等待后重试，每个链接最多尝试 max_attempts 次，仍失败的写入 download_report.json。
+    use_archive 为 True 时使用输出目录中的下载记录，已下载过的视频（按短代码和内容哈希判断）直接跳过。
+    progress 为进度回调 progress(阶段, 百分比)，回调中抛出的异常会中止下载
+    on_complete(链接, 文件列表) 在每个视频下载完成（或已存在）时立即在下载线程中调用，用于流水线处理
+    """
+    if not os.path.exists(output_path):
+        os.makedirs(output_path)
+    archive = DownloadArchive(output_path) if use_archive else None
+    own_session = session is None
+    if own_session:
+        session = DownloadSession(output_path)
+    try:
+        return _download_batch(links, output_path, session, progress, concurrency, limiter, archive, max_attempts,
+                               on_complete)
+    finally:
+        if own_session:
+            session.close()
+
+def _download_batch(links, output_path, session, progress, concurrency, limiter, archive=None,
+                    max_attempts=MAX_ATTEMPTS, on_complete=None):
+    """按调度队列下载一批链接，失败的链接以指数退避重新排队，返回最终失败的链接"""
+    limiter = limiter or HostRateLimiter()
+    # 同一个视频的不同链接（如查询参数不同）只下载一次
+    unique = {}
+    for link in links:
+        unique.setdefault(archive_key(link), link)
+    links = list(unique.values())
+    total = len(links)
+
+    def completed(link, files):
+        if on_complete is None:
+            return
         try:
-            print(f"\n[{i}/{len(links)}] 正在下载: {link}")
-            
-            # 每次下载前更新User-Agent
-            ydl_opts['http_headers']['User-Agent'] = get_random_user_agent()
-            
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([link])
-            
-            # 模拟真实用户行为的随机延迟
-            delay = get_random_delay()
-            print(f"等待 {delay:.1f} 秒后继续...")
-            time.sleep(delay)
-            
+            on_complete(link, files)
+        except Exception as e:
+            print(f"处理下载结果时出错: {str(e)}")
+
+    def download_task(i, link, attempt):
+        files = archive.lookup(link) if archive is not None else None
+        if files:
+            print(f"\n[{i}/{total}] 已下载过，跳过: {link}")
+            completed(link, files)
+            return True, None
+        session.prepare()
+        limiter.acquire(link)
+        retry_note = f"（第 {attempt} 次尝试）" if attempt > 1 else ""
+        print(f"\n[{i}/{total}] 正在下载{retry_note}: {link}")
+        try:
+            files = session.download(link)
+            if not files:
+                raise RuntimeError("没有下载到文件")
+            if archive is not None:
+                files = archive.record(link, files)
+            completed(link, files)
+            return True, None
         except Exception as e:
             print(f"下载失败: {str(e)}")
-            # 发生错误时增加额外延迟
-            time.sleep(random.uniform(5, 8))
-            continue
+            # 失败后让该域名暂停一段时间，不阻塞其他下载
+            limiter.penalize(link, FAILURE_PENALTY)
+            return False, str(e)
+
+    # 调度队列：(可以开始的时间, 序号, 链接, 第几次尝试)。失败的链接放回队列末尾，等待退避时间后重试，
+    # 等待期间其他链接照常下载
+    queue = [(0.0, i, link, 1) for i, link in enumerate(links, 1)]
+    heapq.heapify(queue)
+    retry_budget = max(5, int(total * RETRY_BUDGET_RATIO))
+    failures = {}  # 链接 -> {'link', 'attempts', 'error'}
+    done = 0
+    if progress is not None:
+        progress(f"下载 0/{total}", 0)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        running = {}
+        try:
+            while queue or running:
+                now = time.monotonic()
+                while queue and len(running) < max(1, concurrency) and queue[0][0] <= now:
+                    _, i, link, attempt = heapq.heappop(queue)
+                    running[pool.submit(download_task, i, link, attempt)] = (i, link, attempt)
+                # 等待任一下载结束，或下一个重试到期
+                timeout = None
+                if queue and len(running) < max(1, concurrency):
+                    timeout = min(max(0.0, queue[0][0] - now), 1.0)
+                if not running:
+                    if progress is not None:
+                        progress(f"等待重试 {done}/{total}")  # 等待期间也能响应取消
+                    time.sleep(timeout)
+                    continue
+                finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i, link, attempt = running.pop(future)
+                    success, error = future.result()
+                    if success:
+                        failures.pop(link, None)
+                    else:
+                        failures[link] = {'link': link, 'attempts': attempt, 'error': error}
+                        permanent = any(marker in (error or '') for marker in PERMANENT_ERRORS)
+                        if attempt < max_attempts and retry_budget > 0 and not permanent:
+                            retry_budget -= 1
+                            delay = min(RETRY_BASE_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+                            delay *= random.uniform(0.8, 1.2)
+                            print(f"{delay:.0f} 秒后重试: {link}")
+                            heapq.heappush(queue, (time.monotonic() + delay, i, link, attempt + 1))
+                            continue
+                    done += 1
+                    if progress is not None:
+                        progress(f"下载 {done}/{total}", 100 * done / total)
+        except BaseException:
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+
+    failed = [link for link in links if link in failures]
+    write_report(output_path, total, [failures[link] for link in failed])
+    print(f"\n下载完成: 成功 {total - len(failed)} 个，失败 {len(failed)} 个")
+    for link in failed:
+        print(f"- 失败: {link}（尝试 {failures[link]['attempts']} 次）: {failures[link]['error']}")
+    return failed
+
+def write_report(output_path, total, failures):
+    """把本批次仍然失败的链接写入输出目录的 download_report.json"""
+    report = {
+        'finished': datetime.now().isoformat(timespec='seconds'),
+        'total': total,
+        'succeeded': total - len(failures),
+        'failed': failures,
+    }
+    try:
+        with open(os.path.join(output_path, REPORT_NAME), 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print(f"写入下载报告失败: {str(e)}")
 
 if __name__ == "__main__":
-    # 指定包含链接的文本文件路径
-    links_file = "links.txt"  # 你可以修改为实际的文件路径
-    
-    # 使用txt文件名（不包括扩展名）作为输出目录
-    output_folder = os.path.splitext(os.path.basename(links_file))[0]
-
-    print("开始提取链接...")
-    links = extract_instagram_links(links_file)
-    
-    if not links:
-        print("未找到任何 Instagram 链接")
-        exit()
-    
-    # 随机打乱链接顺序
-    random.shuffle(links)
-    
+    parser = argparse.ArgumentParser(description='Instagram视频批量下载')
+    parser.add_argument('-i', '--input', default='links.txt', help='包含视频链接的文本文件')
+    parser.add_argument('-o', '--output', help='输出目录，默认使用链接文件名')
+    parser.add_argument('-s', '--single', help='单个视频链接')
+    parser.add_argument('-j', '--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='同时进行的下载数')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='每个域名每秒最多发起的下载数')
+    parser.add_argument('--no_archive', action='store_true', help='不使用下载记录，重新下载所有链接')
+    parser.add_argument('--max_attempts', type=int, default=MAX_ATTEMPTS, help='每个链接最多尝试的次数')
+    args = parser.parse_args()
+
+    if args.single:
+        links = [args.single]
+        output_folder = args.output or 'downloads'
+    else:
+        # 指定包含链接的文本文件路径
+        links_file = args.input
+
+        # 使用txt文件名（不包括扩展名）作为输出目录
+        output_folder = args.output or os.path.splitext(os.path.basename(links_file))[0]
+
+        print("开始提取链接...")
+        links = extract_instagram_links(links_file)
+
+        if not links:
+            print("未找到任何 Instagram 链接")
+            exit()
+
+        # 随机打乱链接顺序
+        random.shuffle(links)
+
     print(f"找到 {len(links)} 个链接")
     print(f"视频将保存到 {output_folder} 目录")
     print("开始下载视频...")
-    download_videos(links, output_folder)
+    download_videos(links, output_folder, concurrency=args.concurrency, limiter=HostRateLimiter(rate=args.rate),
+                    use_archive=not args.no_archive, max_attempts=args.max_attempts)
@@ -1,27 +1,43 @@
-from moviepy.editor import VideoFileClip, concatenate_videoclips, ImageClip, AudioFileClip
-from PIL import Image, ImageDraw, ImageFont
-import numpy as np
+from PIL import Image, ImageDraw
 import os
+import re
 from datetime import datetime
 import gc
 import csv
 import logging
 import sys
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from contextlib import contextmanager
+from ffmpeg_utils import run_ffmpeg, scale_filter, fit_size, SCALE_MODES
+from transition_cache import TransitionCache
+from font_registry import get_font, get_registry
+from segment_cache import SegmentManifest
+from ffmpeg_backend import render_timeline
+from trim_planner import plan_trim, encoded_seconds, DEFAULT_SNAP
+from renditions import plan_renditions, render_renditions, moviepy_fan_out_params
+from probe_index import get_index, probe_videos
+from clip_dedup import drop_duplicates
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('video_merger.log', encoding='utf-8')
-    ]
-)
+# moviepy、numpy 导入较慢，只在使用moviepy合并时按需导入（见 moviepy_clips.py）
 
-# 设置第三方库的日志级别
-logging.getLogger('PIL').setLevel(logging.WARNING)
-logging.getLogger('moviepy').setLevel(logging.WARNING)
+def setup_logging(log_file='video_merger.log'):
+    """配置日志输出到控制台和日志文件（命令行和Web界面启动时调用，导入本模块时不创建日志文件）"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler(log_file, encoding='utf-8')
+        ]
+    )
+
+    # 设置第三方库的日志级别
+    logging.getLogger('PIL').setLevel(logging.WARNING)
+    logging.getLogger('moviepy').setLevel(logging.WARNING)
 
 # 颜色方案配置
 COLOR_SCHEMES = {
@@ -57,6 +73,40 @@ COLOR_SCHEMES = {
     }
 }
 
+# 快速合并（流复制）时对输入视频的要求
+STREAM_COPY_VIDEO_CODEC = 'h264'
+STREAM_COPY_AUDIO_CODEC = 'aac'
+STREAM_COPY_PIX_FMT = 'yuv420p'
+X264_PROFILES = ('baseline', 'main', 'high')
+# 流复制剪辑时，不在关键帧上的头尾重新编码使用的质量
+TRIM_CRF = 18
+
+# 分块合并的内存估算：进程基础占用，以及每个同时打开的视频（解码进程、帧缓冲、音频缓冲）和每个ffmpeg转码进程的占用
+BASE_MEMORY = 300 * 1024 * 1024
+CLIP_MEMORY = 60 * 1024 * 1024
+NORMALIZE_MEMORY = 200 * 1024 * 1024
+MEMORY_UNITS = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+# 可选的渲染方式
+MERGE_BACKENDS = ('auto', 'ffmpeg', 'moviepy')
+
+# 过渡画面绘制逻辑的版本号，修改绘制代码后递增以使旧缓存失效
+TRANSITION_VERSION = 1
+
+# 并行转码时中间片段的统一规格（过渡片段使用相同参数，保证可以流复制拼接）
+NORMALIZED_PARAMS = {
+    'frame_rate': '30',
+    'pix_fmt': 'yuv420p',
+    'profile': 'high',
+    'level': '4.0',
+    'timescale': '15360',
+    'sample_rate': 44100,
+    'channels': 2,
+    'preset': 'medium',
+    'bitrate': '4000k',
+    'audio_bitrate': '192k',
+}
+
 @contextmanager
 def managed_resource(resource, resource_type="resource"):
     """资源管理器，确保资源被正确释放"""
@@ -66,10 +116,7 @@ def managed_resource(resource, resource_type="resource"):
         if resource is not None:
             try:
                 # 处理不同类型的资源
-                if isinstance(resource, (VideoFileClip, ImageClip, AudioFileClip)):
-                    if hasattr(resource, 'close'):
-                        resource.close()
-                elif isinstance(resource, Image.Image):
+                if isinstance(resource, Image.Image):
                     if hasattr(resource, 'close'):
                         try:
                             resource.close()
@@ -84,172 +131,299 @@ def managed_resource(resource, resource_type="resource"):
             except Exception as e:
                 logging.debug(f"Error closing {resource_type}: {str(e)}")
 
-def create_number_transition(number, duration=1.0, size=(720, 1280), is_final=False, video_count=None, title_text="今日份快乐", author_name="", color_scheme='p6'):
-    """创建带数字的过渡画面"""
-    try:
-        # 获取颜色方案
-        scheme = COLOR_SCHEMES.get(color_scheme, COLOR_SCHEMES['p6'])
-        bg_color = scheme['background']
-        text_color = scheme['text']
+def render_transition_image(number, size=(720, 1280), is_final=False, title_text="今日份快乐", author_name="", color_scheme='p6'):
+    """绘制过渡画面图片，返回PIL Image"""
+    # 获取颜色方案
+    scheme = COLOR_SCHEMES.get(color_scheme, COLOR_SCHEMES['p6'])
+    bg_color = scheme['background']
+    text_color = scheme['text']
+    
+    # 创建背景
+    width, height = size
+    background = Image.new('RGB', (width, height), bg_color)
+    draw = ImageDraw.Draw(background)
+    
+    if not is_final:
+        # 普通过渡画面：显示数字
+        # 加载字体
+        font = get_font('latin', 80)
         
-        # 创建背景
-        width, height = size
-        background = Image.new('RGB', (width, height), bg_color)
-        draw = ImageDraw.Draw(background)
+        # 计算文字大小和位置
+        text = str(number)
+        bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
         
-        if not is_final:
-            # 普通过渡画面：显示数字
-            # 加载字体
-            try:
-                font = ImageFont.truetype("arial.ttf", 80)
-            except:
-                font = ImageFont.load_default()
-            
-            # 计算文字大小和位置
-            text = str(number)
-            bbox = draw.textbbox((0, 0), text, font=font)
-            text_width = bbox[2] - bbox[0]
-            text_height = bbox[3] - bbox[1]
-            
-            # 获取字体的度量信息以进行精确定位
-            ascent, descent = font.getmetrics()
-            
-            # 计算圆的大小和位置
-            circle_radius = max(text_width, text_height) * 0.8
-            circle_x = width // 2
-            circle_y = height // 2
-            
-            # 绘制圆形
-            circle_bbox = [
-                circle_x - circle_radius,
-                circle_y - circle_radius,
-                circle_x + circle_radius,
-                circle_y + circle_radius
-            ]
-            draw.ellipse(circle_bbox, outline=text_color, width=5)
-            
-            # 计算文字的精确位置，考虑字体的基线偏移
-            text_offset = (ascent - descent) // 2  # 考虑字体的基线偏移
-            text_x = circle_x - text_width // 2
-            text_y = circle_y - text_height // 2 - text_offset // 2  # 微调垂直位置
+        # 获取字体的度量信息以进行精确定位
+        ascent, descent = font.getmetrics()
+        
+        # 计算圆的大小和位置
+        circle_radius = max(text_width, text_height) * 0.8
+        circle_x = width // 2
+        circle_y = height // 2
+        
+        # 绘制圆形
+        circle_bbox = [
+            circle_x - circle_radius,
+            circle_y - circle_radius,
+            circle_x + circle_radius,
+            circle_y + circle_radius
+        ]
+        draw.ellipse(circle_bbox, outline=text_color, width=5)
+        
+        # 计算文字的精确位置，考虑字体的基线偏移
+        text_offset = (ascent - descent) // 2  # 考虑字体的基线偏移
+        text_x = circle_x - text_width // 2
+        text_y = circle_y - text_height // 2 - text_offset // 2  # 微调垂直位置
+        
+        # 绘制数字
+        draw.text((text_x, text_y), text, font=font, fill=text_color)
+        
+        # 只在第一个过渡画面显示作者名称
+        if number == 1 and author_name:
+            # 使用较小的字体大小（中文字体，作者名可能包含中文）
+            author_font = get_font('cjk', 40)
             
-            # 绘制数字
-            draw.text((text_x, text_y), text, font=font, fill=text_color)
+            # 在数字下方显示作者名称
+            author_text = f"@{author_name}"  # 添加@符号
+            author_bbox = draw.textbbox((0, 0), author_text, font=author_font)
+            author_x = (width - (author_bbox[2] - author_bbox[0])) // 2
+            author_y = circle_y + circle_radius + text_height + 320  # 在数字下方20像素处
             
-            # 只在第一个过渡画面显示作者名称
-            if number == 1 and author_name:
-                # 使用较小的字体大小
-                try:
-                    author_font = ImageFont.truetype("C:\\Windows\\Fonts\\msyh.ttc", 40)  # 微软雅黑
-                except:
-                    try:
-                        author_font = ImageFont.truetype("C:\\Windows\\Fonts\\simhei.ttf", 40)  # 黑体
-                    except:
-                        author_font = ImageFont.load_default()
+            # 绘制作者名称
+            draw.text((author_x, author_y), author_text, font=author_font, fill=text_color)
+        
+        # 如果是第一个画面，添加标题
+        if number == 1:
+            try:
+                # 标题字体
+                title_font_size = 60
+                title_font = get_font('cjk', title_font_size)
                 
-                # 在数字下方显示作者名称
-                author_text = f"@{author_name}"  # 添加@符号
-                author_bbox = draw.textbbox((0, 0), author_text, font=author_font)
-                author_x = (width - (author_bbox[2] - author_bbox[0])) // 2
-                author_y = circle_y + circle_radius + text_height + 320  # 在数字下方20像素处
+                # 标题文本和日期
+                today = datetime.now()
+                date_text = today.strftime("%m-%d")
                 
-                # 绘制作者名称
-                draw.text((author_x, author_y), author_text, font=author_font, fill=text_color)
-            
-            # 如果是第一个画面，添加标题
-            if number == 1:
-                try:
-                    # 标题字体
-                    title_font_size = 60
-                    try:
-                        title_font = ImageFont.truetype("simhei.ttf", title_font_size)
-                    except:
-                        try:
-                            title_font = ImageFont.truetype("arial.ttf", title_font_size)
-                        except:
-                            title_font = ImageFont.load_default()
-                    
-                    # 标题文本和日期
-                    today = datetime.now()
-                    date_text = today.strftime("%m-%d")
-                    
-                    # 计算标题位置
-                    bbox = draw.textbbox((0, 0), title_text, font=title_font)
-                    title_width = bbox[2] - bbox[0]
-                    title_height = bbox[3] - bbox[1]
-                    
-                    # 计算日期位置
-                    date_bbox = draw.textbbox((0, 0), date_text, font=title_font)
-                    date_width = date_bbox[2] - date_bbox[0]
-                    
-                    # 计算文字总高度（包括间距）
-                    total_text_height = title_height + 20 + date_bbox[3] - date_bbox[1]  # 20是两行文字间的间距
-                    
-                    # 计算整个标题框的尺寸
-                    padding = 20  # 文字和边框的间距
-                    box_width = max(title_width, date_width) + (padding * 2)
-                    box_height = total_text_height + (padding * 2)
-                    
-                    # 计算标题框的位置（居中）
-                    box_x = (width - box_width) // 2
-                    box_y = circle_y - circle_radius - 320 - (box_height - total_text_height) // 2
-                    
-                    # 绘制边框
-                    draw.rectangle(
-                        [box_x, box_y, box_x + box_width, box_y + box_height],
-                        outline=text_color,
-                        width=3
-                    )
-                    
-                    # 在边框内居中绘制日期
-                    date_x = (width - date_width) // 2
-                    date_y = box_y + padding
-                    draw.text((date_x, date_y), date_text, font=title_font, fill=text_color)
-                    
-                    # 在日期下方居中绘制标题
-                    title_x = (width - title_width) // 2
-                    title_y = date_y + title_height + padding  # 日期下方padding像素
-                    draw.text((title_x, title_y), title_text, font=title_font, fill=text_color)
-                    
-                except Exception as e:
-                    logging.warning(f"添加标题失败: {str(e)}")
-            
-        else:
-            # 最后的过渡画面：显示三行文字
-            try:
-                font = ImageFont.truetype("simhei.ttf", 80)  # 使用更大的字体
-            except:
-                try:
-                    font = ImageFont.truetype("arial.ttf", 80)
-                except:
-                    font = ImageFont.load_default()
-            
-            texts = ["★ 点赞支持 ★", "☆ 关注收藏 ☆", "◆ 转发分享 ◆"]
-            text_height = height // 4  # 从1/4处开始绘制
-            
-            for text in texts:
-                # 计算每行文字的位置
-                bbox = draw.textbbox((0, 0), text, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_x = (width - text_width) // 2
+                # 计算标题位置
+                bbox = draw.textbbox((0, 0), title_text, font=title_font)
+                title_width = bbox[2] - bbox[0]
+                title_height = bbox[3] - bbox[1]
+                
+                # 计算日期位置
+                date_bbox = draw.textbbox((0, 0), date_text, font=title_font)
+                date_width = date_bbox[2] - date_bbox[0]
+                
+                # 计算文字总高度（包括间距）
+                total_text_height = title_height + 20 + date_bbox[3] - date_bbox[1]  # 20是两行文字间的间距
+                
+                # 计算整个标题框的尺寸
+                padding = 20  # 文字和边框的间距
+                box_width = max(title_width, date_width) + (padding * 2)
+                box_height = total_text_height + (padding * 2)
+                
+                # 计算标题框的位置（居中）
+                box_x = (width - box_width) // 2
+                box_y = circle_y - circle_radius - 320 - (box_height - total_text_height) // 2
                 
-                # 绘制文字
-                draw.text((text_x, text_height), text, font=font, fill=text_color)
-                text_height += 150  # 行间距
+                # 绘制边框
+                draw.rectangle(
+                    [box_x, box_y, box_x + box_width, box_y + box_height],
+                    outline=text_color,
+                    width=3
+                )
+                
+                # 在边框内居中绘制日期
+                date_x = (width - date_width) // 2
+                date_y = box_y + padding
+                draw.text((date_x, date_y), date_text, font=title_font, fill=text_color)
+                
+                # 在日期下方居中绘制标题
+                title_x = (width - title_width) // 2
+                title_y = date_y + title_height + padding  # 日期下方padding像素
+                draw.text((title_x, title_y), title_text, font=title_font, fill=text_color)
+                
+            except Exception as e:
+                logging.warning(f"添加标题失败: {str(e)}")
         
-        # 保存图片
-        image_path = f'transition_{number}.png'
-        background.save(image_path)
+    else:
+        # 最后的过渡画面：显示三行文字
+        font = get_font('cjk', 80)  # 使用更大的字体
         
-        # 创建视频片段
-        clip = ImageClip(image_path).set_duration(duration)
+        texts = ["★ 点赞支持 ★", "☆ 关注收藏 ☆", "◆ 转发分享 ◆"]
+        text_height = height // 4  # 从1/4处开始绘制
         
-        # 添加音效
+        for text in texts:
+            # 计算每行文字的位置
+            bbox = draw.textbbox((0, 0), text, font=font)
+            text_width = bbox[2] - bbox[0]
+            text_x = (width - text_width) // 2
+            
+            # 绘制文字
+            draw.text((text_x, text_height), text, font=font, fill=text_color)
+            text_height += 150  # 行间距
+    
+    return background
+
+_chime_cache = {}
+_chime_lock = threading.Lock()
+
+def get_chime_audio(path="ding.wav"):
+    """解码一次音效文件，返回所有过渡画面共用的音频片段，找不到时返回None"""
+    with _chime_lock:
+        if path not in _chime_cache:
+            try:
+                import numpy as np
+                from moviepy.audio.io.AudioFileClip import AudioFileClip
+                from moviepy.audio.AudioClip import AudioArrayClip
+                with AudioFileClip(path) as audio:
+                    fps = audio.fps
+                    samples = audio.get_frame(np.arange(0, audio.duration, 1.0 / fps))
+                _chime_cache[path] = AudioArrayClip(samples, fps=fps)
+            except Exception as e:
+                logging.warning(f"未找到音效文件 {path}: {str(e)}")
+                _chime_cache[path] = None
+        return _chime_cache[path]
+
+class ReaderPool:
+    """限制同时打开的视频/音频读取器数量，超过上限时关闭最久未使用的读取器"""
+
+    def __init__(self, max_open=2):
+        self.max_open = max(1, max_open)
+        self._readers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key, opener):
+        """获取读取器，未打开时调用 opener 打开"""
+        with self._lock:
+            reader = self._readers.get(key)
+            if reader is not None:
+                self._readers.move_to_end(key)
+                return reader
+            while len(self._readers) >= self.max_open:
+                _, oldest = self._readers.popitem(last=False)
+                self._close(oldest)
+            reader = opener()
+            self._readers[key] = reader
+            return reader
+
+    def release(self, key):
+        """立即关闭指定读取器"""
+        with self._lock:
+            reader = self._readers.pop(key, None)
+        if reader is not None:
+            self._close(reader)
+
+    def close_all(self):
+        with self._lock:
+            readers = list(self._readers.values())
+            self._readers.clear()
+        for reader in readers:
+            self._close(reader)
+
+    @staticmethod
+    def _close(reader):
         try:
-            audio = AudioFileClip("ding.wav").set_duration(duration)
-            clip = clip.set_audio(audio)
-        except:
-            logging.warning("未找到音效文件 ding.wav")
+            reader.close()
+        except Exception as e:
+            logging.debug(f"关闭读取器失败: {str(e)}")
+
+def source_size(video_file, info=None):
+    """返回视频（旋转后）的显示尺寸 (宽, 高)"""
+    if info is not None and info.get('width'):
+        width, height, rotation = info['width'], info['height'], info.get('rotation', 0)
+    else:
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+        file_infos = ffmpeg_parse_infos(video_file)
+        width, height = file_infos['video_size']
+        rotation = file_infos.get('video_rotation', 0)
+    if rotation in (90, 270):
+        width, height = height, width
+    return width, height
+
+def decode_size(video_file, info=None, size=(720, 1280), scale_mode='stretch'):
+    """解码器直接输出的尺寸：拉伸时为目标尺寸，否则为保持比例的最大尺寸"""
+    if scale_mode == 'stretch':
+        return tuple(size)
+    return fit_size(source_size(video_file, info), size)
+
+def load_scaled_clip(video_file, info=None, size=(720, 1280), scale_mode='stretch'):
+    """打开视频时让解码器直接输出目标分辨率（ffmpeg内部缩放），需要时再补边"""
+    from moviepy.video.io.VideoFileClip import VideoFileClip
+    from moviepy_clips import fill_frame
+    decode_width, decode_height = decode_size(video_file, info, size, scale_mode)
+    clip = VideoFileClip(video_file, target_resolution=(decode_height, decode_width))
+    if (decode_width, decode_height) == tuple(size):
+        return clip
+    return clip.fl_image(lambda frame: fill_frame(frame, size, scale_mode))
+
+def parse_sources(videos):
+    """把合并源列表拆分为 (文件路径列表, 剪辑范围列表)
+
+    每项可以是文件路径，或 {'path': 文件路径, 'start': 起点秒数, 'end': 终点秒数} 字典（起点、终点可以省略）。
+    没有指定起点和终点的视频剪辑范围为None。
+    """
+    video_files, trims = [], []
+    for video in videos:
+        if isinstance(video, dict):
+            path, start, end = video['path'], video.get('start'), video.get('end')
+        else:
+            path, start, end = video, None, None
+        if start is not None and end is not None and end <= start:
+            raise ValueError(f"剪辑范围无效: {os.path.basename(path)} {start}-{end}")
+        video_files.append(os.path.abspath(path))
+        trims.append(None if start is None and end is None else (start, end))
+    return video_files, trims
+
+def trim_range(duration, trim=None):
+    """计算视频实际使用的时间范围 (起点, 终点)：没有指定终点时去掉最后0.5秒"""
+    start, end = trim or (None, None)
+    start = start or 0.0
+    if end is None:
+        end = duration - 0.5 if duration > 1 else duration  # 去掉最后0.5秒
+    else:
+        end = min(end, duration)
+    if end <= start:
+        raise ValueError(f"剪辑范围超出视频长度: {start:.3f}-{end:.3f}")
+    return start, end
+
+def clip_timing(video_file, info=None, trim=None):
+    """返回视频使用部分的起点、时长和是否有音频，没有探测信息时用ffmpeg读取（不保持读取器）"""
+    if info is not None:
+        duration = info['duration']
+        has_audio = info['acodec'] is not None
+    else:
+        from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+        file_infos = ffmpeg_parse_infos(video_file)
+        duration = file_infos.get('duration') or 0
+        has_audio = file_infos.get('audio_found', False)
+    if duration <= 0:
+        raise Exception("视频长度无效")
+    start, end = trim_range(duration, trim)
+    return start, end - start, has_audio
+
+def load_lazy_clip(video_file, info, pool, size=(720, 1280), scale_mode='stretch', trim=None):
+    """创建按需打开的视频片段（默认去掉最后0.5秒），只读取视频信息不保持读取器"""
+    from moviepy_clips import LazyVideoFileClip
+    start, duration, has_audio = clip_timing(video_file, info, trim)
+    return LazyVideoFileClip(video_file, duration, pool, size=size, has_audio=has_audio,
+                             decode_size=decode_size(video_file, info, size, scale_mode), scale_mode=scale_mode,
+                             start=start)
+
+def create_number_transition(number, duration=1.0, size=(720, 1280), is_final=False, video_count=None, title_text="今日份快乐", author_name="", color_scheme='p6'):
+    """创建带数字的过渡画面"""
+    import numpy as np
+    from moviepy.video.VideoClip import ImageClip
+    try:
+        background = render_transition_image(number, size=size, is_final=is_final, title_text=title_text,
+                                             author_name=author_name, color_scheme=color_scheme)
+        
+        # 直接使用内存中的图片创建视频片段
+        clip = ImageClip(np.array(background)).set_duration(duration)
+        
+        # 添加音效（所有过渡画面共用一份解码后的音频）
+        chime = get_chime_audio()
+        if chime is not None:
+            clip = clip.set_audio(chime.set_duration(duration))
         
         return clip
         
@@ -257,9 +431,646 @@ def create_number_transition(number, duration=1.0, size=(720, 1280), is_final=Fa
         logging.error(f"创建过渡画面时出错: {str(e)}")
         return None
 
-def merge_videos(input_dir=None, output_path=None, title="今日份快乐", author="", color_scheme='p6'):
-    """合并视频文件，添加过渡画面"""
+def check_stream_copy_compatible(infos, size=(720, 1280)):
+    """检查视频参数是否一致，能否跳过重新编码直接拼接，返回 (是否兼容, 原因)"""
+    if not infos:
+        return False, "没有视频信息"
+    if any(info is None for info in infos):
+        return False, "部分视频无法探测（需要ffprobe）"
+
+    first = infos[0]
+    for info in infos:
+        name = os.path.basename(info['path'])
+        if info['vcodec'] != STREAM_COPY_VIDEO_CODEC:
+            return False, f"{name} 视频编码为 {info['vcodec']}"
+        if (info['width'], info['height']) != tuple(size):
+            return False, f"{name} 分辨率为 {info['width']}x{info['height']}"
+        if info['rotation']:
+            return False, f"{name} 带有旋转信息"
+        if info['pix_fmt'] != STREAM_COPY_PIX_FMT:
+            return False, f"{name} 像素格式为 {info['pix_fmt']}"
+        if _x264_profile(info['profile']) is None:
+            return False, f"{name} 编码配置为 {info['profile']}"
+        if info['acodec'] != STREAM_COPY_AUDIO_CODEC:
+            return False, f"{name} 音频编码为 {info['acodec']}"
+        if not info['fps'] or abs(info['fps'] - first['fps']) > 0.01:
+            return False, f"{name} 帧率不一致"
+        for key in ('profile', 'level', 'time_base', 'sample_rate', 'channels'):
+            if info[key] != first[key]:
+                return False, f"{name} 的 {key} 与其他视频不一致"
+    return True, ""
+
+def _x264_profile(profile):
+    """将ffprobe的profile名称转换为libx264参数"""
+    if not profile:
+        return None
+    name = profile.lower().replace('constrained ', '')
+    return name if name in X264_PROFILES else None
+
+def _segment_params(info):
+    """根据参考视频生成过渡片段的编码参数"""
+    level = info.get('level')
+    return {
+        'frame_rate': info['frame_rate'],
+        'pix_fmt': info['pix_fmt'],
+        'profile': _x264_profile(info['profile']),
+        'level': f"{level / 10:.1f}" if level and level > 0 else None,
+        'timescale': info['time_base'].split('/')[-1] if info.get('time_base') else None,
+        'sample_rate': info['sample_rate'],
+        'channels': info['channels'],
+    }
+
+def encode_transition_segment(image, output_path, params, duration=1.0):
+    """将过渡画面编码为与视频参数一致的片段，供流复制拼接使用
+
+    画面以原始RGB数据通过管道传给ffmpeg，不落地为图片文件
+    """
+    image = image.convert('RGB')
+    width, height = image.size
+    args = ['-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}',
+            '-framerate', params['frame_rate'], '-i', 'pipe:0']
+    if os.path.exists("ding.wav"):
+        args += ['-i', "ding.wav"]
+        audio_filter = 'apad'
+    else:
+        logging.warning("未找到音效文件 ding.wav，使用静音")
+        args += ['-f', 'lavfi', '-i', f"anullsrc=r={params['sample_rate']}"]
+        audio_filter = 'anull'
+    args += ['-map', '0:v', '-map', '1:a', '-t', str(duration),
+             '-vf', 'loop=loop=-1:size=1:start=0', '-af', audio_filter,
+             '-c:v', 'libx264', '-preset', 'medium', '-tune', 'stillimage',
+             '-pix_fmt', params['pix_fmt'], '-r', params['frame_rate']]
+    if params['profile']:
+        args += ['-profile:v', params['profile']]
+    if params['level']:
+        args += ['-level', params['level']]
+    if params['timescale']:
+        args += ['-video_track_timescale', params['timescale']]
+    args += ['-c:a', 'aac', '-b:a', '192k',
+             '-ar', str(params['sample_rate']), '-ac', str(params['channels']),
+             output_path]
+    run_ffmpeg(args, "过渡片段编码", input=image.tobytes())
+    return output_path
+
+def _transition_cache_key(number, is_final, title_text, author_name, color_scheme, size, duration, params):
+    """生成过渡片段的缓存key，只包含实际影响画面的参数"""
+    scheme = COLOR_SCHEMES.get(color_scheme, COLOR_SCHEMES['p6'])
+    fields = {
+        'version': TRANSITION_VERSION,
+        'colors': [scheme['background'], scheme['text']],
+        'size': list(size),
+        'duration': duration,
+        'params': params,
+        'fonts': get_registry().resolution,
+    }
+    if is_final:
+        fields['kind'] = 'final'
+    else:
+        fields['number'] = number
+        if number == 1:  # 只有第一个过渡画面带标题、日期和作者
+            fields['title'] = title_text
+            fields['author'] = author_name
+            fields['date'] = datetime.now().strftime("%m-%d")
+    try:
+        stat = os.stat("ding.wav")
+        fields['chime'] = [stat.st_size, int(stat.st_mtime)]
+    except OSError:
+        fields['chime'] = None
+    return TransitionCache.make_key(**fields)
+
+def build_transition_segment(number, output_path, params, size=(720, 1280), is_final=False, title_text="今日份快乐",
+                             author_name="", color_scheme='p6', duration=1.0, cache=None):
+    """生成已编码的过渡片段，优先使用缓存"""
+    key = None
+    if cache is not None:
+        key = _transition_cache_key(number, is_final, title_text, author_name, color_scheme, size, duration, params)
+        if cache.fetch(key, output_path):
+            return output_path
+
+    image = render_transition_image(number, size=size, is_final=is_final, title_text=title_text,
+                                    author_name=author_name, color_scheme=color_scheme)
+    encode_transition_segment(image, output_path, params, duration=duration)
+    if cache is not None:
+        cache.put(key, output_path)
+    return output_path
+
+def concat_segments(segments, output_path, normalize_audio=False):
+    """使用ffmpeg concat demuxer拼接片段，不重新编码
+
+    segments 为字典列表：{'path': 文件路径, 'inpoint': 可选起点, 'outpoint': 可选终点}
+    normalize_audio 为 True 时视频仍然流复制，音频统一重新编码（各片段声道数可能不同时使用）
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as list_file:
+        for segment in segments:
+            escaped = os.path.abspath(segment['path']).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+            if segment.get('inpoint'):
+                list_file.write(f"inpoint {segment['inpoint']:.3f}\n")
+            if segment.get('outpoint'):
+                list_file.write(f"outpoint {segment['outpoint']:.3f}\n")
+        list_path = list_file.name
+    try:
+        codec_args = ['-c', 'copy']
+        if normalize_audio:
+            codec_args = ['-c:v', 'copy', '-c:a', 'aac', '-b:a', NORMALIZED_PARAMS['audio_bitrate'],
+                          '-ar', str(NORMALIZED_PARAMS['sample_rate']), '-ac', str(NORMALIZED_PARAMS['channels'])]
+        run_ffmpeg(['-f', 'concat', '-safe', '0', '-i', list_path,
+                    '-map', '0'] + codec_args + ['-movflags', '+faststart', output_path],
+                   "片段拼接")
+    finally:
+        os.remove(list_path)
+
+def _report(progress, stage, percent=None):
+    """报告合并进度；progress 回调可以抛出异常来中止合并"""
+    if progress is not None:
+        progress(stage, percent)
+
+def encode_trim_segment(source, output_path, start, end, params):
+    """把视频中的一小段重新编码为与源视频参数一致的片段，和流复制的部分直接拼接"""
+    args = ['-ss', f"{start:.3f}", '-i', source, '-t', f"{end - start:.3f}",
+            '-map', '0:v:0', '-map', '0:a:0?',
+            '-c:v', 'libx264', '-preset', 'medium', '-crf', str(TRIM_CRF), '-bf', '0',
+            '-pix_fmt', params['pix_fmt'], '-r', params['frame_rate']]
+    if params['profile']:
+        args += ['-profile:v', params['profile']]
+    if params['level']:
+        args += ['-level', params['level']]
+    if params['timescale']:
+        args += ['-video_track_timescale', params['timescale']]
+    args += ['-c:a', 'aac', '-b:a', '192k',
+             '-ar', str(params['sample_rate']), '-ac', str(params['channels']),
+             output_path]
+    run_ffmpeg(args, f"重新编码 {os.path.basename(source)} {start:.2f}-{end:.2f}秒")
+    return output_path
+
+def copy_trim_segment(source, output_path, start, end, fps=30):
+    """把关键帧之间的一段流复制为单独的片段
+
+    有B帧时按解码时间戳截取会多带上终点的关键帧，与后面重新编码的部分时间戳重叠，所以按显示时间戳丢弃终点及之后的帧
+    """
+    length = end - start
+    run_ffmpeg(['-ss', f"{start:.3f}", '-i', source, '-t', f"{length:.3f}",
+                '-map', '0:v:0', '-map', '0:a:0?', '-c', 'copy',
+                '-bsf:v', f"noise=drop=gte(pts*tb\\,{length - 0.5 / fps:.4f})",
+                '-avoid_negative_ts', 'make_zero', output_path],
+               f"复制 {os.path.basename(source)} {start:.2f}-{end:.2f}秒")
+    return output_path
+
+def plan_clip(info, trim=None):
+    """规划单个视频的剪辑：返回 [(方式, 起点, 终点)]，尽量流复制，只重新编码不在关键帧上的头尾
+
+    默认去掉结尾0.5秒时终点可以提前对齐到附近的关键帧；没有关键帧信息时直接按时间流复制（与之前的行为相同）
+    """
+    start, end = trim_range(info['duration'], trim)
+    if not info.get('keyframes'):
+        return [('copy', start, end)]
+    snap = DEFAULT_SNAP if not trim or trim[1] is None else 0.0
+    return plan_trim(info['keyframes'], start, end, info['duration'], snap=snap)
+
+def _merge_stream_copy(video_files, infos, output_path, title, author, color_scheme, size=(720, 1280), cache=None,
+                       progress=None, trims=None):
+    """快速合并：只编码过渡画面，视频片段直接流复制"""
+    params = _segment_params(infos[0])
+    video_count = len(video_files)
+    trims = trims or [None] * video_count
+    total_seconds = encoded_total = 0.0
+    with tempfile.TemporaryDirectory(prefix='merge_') as temp_dir, \
+            ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as encoder:
+        segments = []
+        for i, (video_file, info) in enumerate(zip(video_files, infos), 1):
+            logging.info(f"处理视频 {i}/{video_count}: {os.path.basename(video_file)}")
+            _report(progress, f"生成过渡片段 {i}/{video_count}", 10 + 60 * (i - 1) / video_count)
+            card_path = os.path.join(temp_dir, f'transition_{i}.mp4')
+            segments.append({'path': build_transition_segment(i, card_path, params, size=size, title_text=title,
+                                                              author_name=author if i == 1 else "",
+                                                              color_scheme=color_scheme, cache=cache)})
+
+            # 在关键帧上的部分流复制，其余部分（通常只有最后一段GOP）在后台重新编码
+            plan = plan_clip(info, trims[i - 1])
+            for n, (mode, start, end) in enumerate(plan):
+                piece_path = os.path.join(temp_dir, f'trim_{i}_{n}.mp4')
+                if mode == 'encode':
+                    segments.append({'future': encoder.submit(encode_trim_segment, video_file, piece_path,
+                                                              start, end, params)})
+                elif info.get('keyframes'):
+                    # 终点在关键帧上，单独复制出来去掉多带的关键帧，避免拼接处时间戳重叠
+                    segments.append({'future': encoder.submit(copy_trim_segment, video_file, piece_path, start, end,
+                                                              info['fps'] or 30)})
+                else:
+                    segments.append({'path': video_file, 'inpoint': start, 'outpoint': end})
+            total_seconds += plan[-1][2] - plan[0][1]
+            encoded_total += encoded_seconds(plan)
+
+        card_path = os.path.join(temp_dir, f'transition_{video_count + 1}.mp4')
+        segments.append({'path': build_transition_segment(video_count + 1, card_path, params, size=size, is_final=True,
+                                                          color_scheme=color_scheme, cache=cache)})
+
+        if encoded_total:
+            logging.info(f"不在关键帧上的剪辑点重新编码 {encoded_total:.1f} 秒（共 {total_seconds:.1f} 秒）")
+        segments = [{'path': segment['future'].result()} if 'future' in segment else segment for segment in segments]
+        logging.info(f"拼接 {len(segments)} 个片段...")
+        _report(progress, "拼接片段", 80)
+        concat_segments(segments, output_path)
+
+def normalize_clip(source, output_path, duration, has_audio=True, threads=1, size=(720, 1280), params=None,
+                   scale_mode='stretch', trim=None):
+    """在子进程中把单个视频的剪辑范围（默认去掉最后0.5秒）转码为统一规格的中间片段"""
+    params = params or NORMALIZED_PARAMS
+    start, end = trim_range(duration, trim) if duration > 0 else (0.0, None)
+    args = ['-ss', f"{start:.3f}"] if start else []
+    args += ['-i', source]
+    if not has_audio:
+        args += ['-f', 'lavfi', '-i', f"anullsrc=r={params['sample_rate']}"]
+    if end is not None:
+        args += ['-t', f"{end - start:.3f}"]
+    if not has_audio:
+        args += ['-shortest']  # 静音输入没有结束，时长未知时以画面结束为准
+    args += ['-map', '0:v:0', '-map', '0:a:0' if has_audio else '1:a',
+             '-vf', f"{scale_filter(size, scale_mode)},fps={params['frame_rate']}",
+             '-c:v', 'libx264', '-preset', params['preset'], '-b:v', params['bitrate'],
+             '-pix_fmt', params['pix_fmt'], '-profile:v', params['profile'], '-level', params['level'],
+             '-threads', str(threads), '-video_track_timescale', params['timescale'],
+             '-c:a', 'aac', '-b:a', params['audio_bitrate'],
+             '-ar', str(params['sample_rate']), '-ac', str(params['channels']),
+             output_path]
+    run_ffmpeg(args, f"转码 {os.path.basename(source)}")
+    return output_path
+
+def _part_path(manifest, key):
+    """转码中的片段文件：每个转码任务使用单独的文件名，完成后再改名为清单中的片段"""
+    return manifest.segment_path(key)[:-len('.mp4')] + f'.{uuid.uuid4().hex[:8]}.part.mp4'
+
+def _remove_parts(paths):
+    """删除转码失败或被取消时留下的片段文件，已改名为清单片段的文件不存在，直接跳过"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _segment_key(manifest, video_file, size=(720, 1280), scale_mode='stretch', trim=None):
+    """并行转码片段在清单中的key：源文件内容哈希 + 裁剪 + 尺寸 + 编码参数 + 缩放方式"""
+    content_hash = manifest.content_hash(video_file)
+    key = manifest.segment_key(content_hash, trim=list(trim) if trim else 0.5, size=list(size),
+                               params=NORMALIZED_PARAMS, scale_mode=scale_mode)
+    return key, content_hash
+
+class SegmentPrefetcher:
+    """边下载边转码：每个视频下载完成后立即探测并在进程池中转码为中间片段，记录到片段清单
+
+    之后对同一目录调用 merge_videos（并行转码路径）时这些片段直接复用，只需生成过渡画面并拼接。
+    参数已符合流复制要求的视频不预转码：全部视频都符合时合并走快速路径，否则在合并时再转码。
+    片段清单位置与 merge_videos 的默认位置相同（输出目录下的 .merge_cache）。
+    """
+
+    def __init__(self, output_path, workers=None, size=(720, 1280), scale_mode='stretch', segment_cache_dir=None):
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        self.manifest = SegmentManifest(segment_cache_dir or os.path.join(output_dir, '.merge_cache'))
+        cpu_count = os.cpu_count() or 1
+        self.workers = max(1, workers or cpu_count)
+        self.threads = max(1, cpu_count // self.workers)
+        self.size = size
+        self.scale_mode = scale_mode
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._lock = threading.Lock()
+        self._keys = set()
+        self._pending = {}  # 转码任务 -> (key, 源文件哈希, 源文件)
+        self._parts = []
+
+    def submit(self, video_file):
+        """提交一个已下载完成的视频，返回是否开始转码（已有片段、可以直接拼接或无法探测时返回False）"""
+        info = probe_videos([video_file])[0]
+        if info is None:
+            logging.warning(f"无法探测视频，合并时再处理: {os.path.basename(video_file)}")
+            return False
+        # 参数已符合流复制要求的视频，合并时多半走快速路径直接拼接，预先转码的片段用不上
+        if check_stream_copy_compatible([info], self.size)[0]:
+            logging.info(f"可以直接拼接，不预转码: {os.path.basename(video_file)}")
+            return False
+        key, content_hash = _segment_key(self.manifest, video_file, self.size, self.scale_mode)
+        with self._lock:
+            if key in self._keys or self.manifest.lookup(key) is not None:
+                return False
+            self._keys.add(key)
+            segment_path = _part_path(self.manifest, key)
+            self._parts.append(segment_path)
+            future = self.pool.submit(normalize_clip, video_file, segment_path, info['duration'],
+                                      info['acodec'] is not None, self.threads, self.size, scale_mode=self.scale_mode)
+            self._pending[future] = (key, content_hash, video_file)
+        logging.info(f"开始转码: {os.path.basename(video_file)}")
+        return True
+
+    def wait(self, progress=None):
+        """等待所有转码完成并保存清单；转码失败的视频留给合并时处理"""
+        with self._lock:
+            pending = dict(self._pending)
+        try:
+            for done, future in enumerate(as_completed(pending), 1):
+                key, content_hash, video_file = pending[future]
+                try:
+                    os.replace(future.result(), self.manifest.segment_path(key))
+                    self.manifest.record(key, content_hash, video_file)
+                except Exception as e:
+                    logging.warning(f"预转码失败 {os.path.basename(video_file)}: {str(e)}")
+                _report(progress, f"转码片段 {done}/{len(pending)}", 100 * done / len(pending))
+        finally:
+            self.close()
+
+    def close(self):
+        """停止未开始的转码，删除没有写入清单的片段文件并保存清单"""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        _remove_parts(self._parts)
+        self.manifest.save()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+@contextmanager
+def _pool_scope(pool, workers):
+    """使用共享的进程池，没有时创建一个只用于本次合并的进程池"""
+    if pool is not None:
+        yield pool
+        return
+    with ProcessPoolExecutor(max_workers=workers) as own_pool:
+        yield own_pool
+
+def _cancel_futures(pool, futures, shared):
+    """合并出错或被取消时停止尚未开始的任务：自己的进程池直接关闭，共享进程池只取消本次合并提交的任务"""
+    if shared:
+        for future in futures:
+            future.cancel()
+        wait(futures)
+    else:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _merge_normalized(video_files, infos, output_path, title, author, color_scheme, workers=None, size=(720, 1280),
+                      cache=None, manifest=None, scale_mode='stretch', progress=None, trims=None, pool=None):
+    """并行合并：每个视频在独立进程中转码为统一规格的中间片段，最后无损拼接
+
+    提供 manifest 时复用内容未变的视频上次转码的片段，只处理新增或修改过的视频
+    提供 pool 时使用共享的进程池（workers 为进程池的大小），否则为本次合并创建进程池
+    """
+    trims = trims or [None] * len(video_files)
+    shared = pool is not None
+    cpu_count = os.cpu_count() or 1
+    if not shared:
+        workers = max(1, min(workers or cpu_count, len(video_files)))
+    else:
+        workers = max(1, workers or cpu_count)
+    threads = max(1, cpu_count // workers)
+    video_count = len(video_files)
+    logging.info(f"并行转码: {workers} 个进程，每个进程 {threads} 个线程")
+
+    with tempfile.TemporaryDirectory(prefix='merge_') as temp_dir:
+        with _pool_scope(pool, workers) as pool:
+            timeline = []  # 按时间线顺序保存片段路径或待完成的任务
+            pending = {}   # 转码任务 -> 完成后要写入清单的信息
+            submitted = {}  # 片段key -> 转码任务，同一内容和剪辑范围的视频在时间线中出现多次时只转码一次
+            parts = []     # 写入清单前的片段文件，出错时删除
+            reused = 0
+            try:
+                for i, (video_file, info) in enumerate(zip(video_files, infos), 1):
+                    card_path = os.path.join(temp_dir, f'transition_{i}.mp4')
+                    timeline.append(pool.submit(build_transition_segment, i, card_path, NORMALIZED_PARAMS, size=size,
+                                                title_text=title, author_name=author if i == 1 else "",
+                                                color_scheme=color_scheme, cache=cache))
+
+                    if manifest is not None:
+                        key, content_hash = _segment_key(manifest, video_file, size, scale_mode, trims[i - 1])
+                        cached_path = manifest.lookup(key)
+                        if cached_path is not None:
+                            timeline.append(cached_path)
+                            reused += 1
+                            continue
+                        if key in submitted:
+                            timeline.append(submitted[key])
+                            continue
+                        segment_path = _part_path(manifest, key)
+                        parts.append(segment_path)
+                    else:
+                        segment_path = os.path.join(temp_dir, f'segment_{i}.mp4')
+
+                    future = pool.submit(normalize_clip, video_file, segment_path, info['duration'],
+                                         info['acodec'] is not None, threads, size, scale_mode=scale_mode,
+                                         trim=trims[i - 1])
+                    timeline.append(future)
+                    if manifest is not None:
+                        pending[future] = (key, content_hash, video_file)
+                        submitted[key] = future
+
+                card_path = os.path.join(temp_dir, f'transition_{video_count + 1}.mp4')
+                timeline.append(pool.submit(build_transition_segment, video_count + 1, card_path, NORMALIZED_PARAMS,
+                                            size=size, is_final=True, color_scheme=color_scheme, cache=cache))
+
+                if reused:
+                    logging.info(f"复用 {reused} 个未变化视频的已转码片段")
+                futures = list(dict.fromkeys(item for item in timeline if not isinstance(item, str)))
+                for done, future in enumerate(as_completed(futures), 1):
+                    result = future.result()  # 抛出子进程中的错误
+                    if future in pending:
+                        key, content_hash, video_file = pending[future]
+                        os.replace(result, manifest.segment_path(key))
+                        manifest.record(key, content_hash, video_file)
+                    logging.info(f"  √ 片段完成 {done}/{len(futures)}")
+                    _report(progress, f"转码片段 {done}/{len(futures)}", 10 + 75 * done / len(futures))
+            except BaseException:
+                _cancel_futures(pool, [item for item in timeline if not isinstance(item, str)], shared)
+                _remove_parts(parts)
+                raise
+            finally:
+                if manifest is not None:
+                    manifest.save()
+
+        segments = []
+        for item in timeline:
+            if isinstance(item, str):
+                segments.append({'path': item})
+            elif item in pending:
+                segments.append({'path': manifest.segment_path(pending[item][0])})
+            else:
+                segments.append({'path': item.result()})
+        logging.info(f"拼接 {len(segments)} 个片段...")
+        _report(progress, "拼接片段", 90)
+        concat_segments(segments, output_path)
+
+def _merge_ffmpeg(video_files, infos, output_path, title, author, color_scheme, size=(720, 1280), scale_mode='stretch',
+                  progress=None, trims=None, renditions=None):
+    """ffmpeg渲染：整个时间线编译成一个filter_complex，一次ffmpeg调用完成缩放、裁剪、拼接和音频"""
+    video_count = len(video_files)
+    trims = trims or [None] * video_count
+    with tempfile.TemporaryDirectory(prefix='merge_') as temp_dir:
+        items = []
+        for i, video_file in enumerate(video_files, 1):
+            card_path = os.path.join(temp_dir, f'transition_{i}.png')
+            render_transition_image(i, size=size, title_text=title, author_name=author if i == 1 else "",
+                                    color_scheme=color_scheme).save(card_path)
+            items.append({'type': 'image', 'path': card_path, 'duration': 1.0})
+
+            start, duration, has_audio = clip_timing(video_file, infos[i - 1] if infos else None, trims[i - 1])
+            items.append({'type': 'video', 'path': video_file, 'start': start, 'duration': duration,
+                          'has_audio': has_audio})
+
+        card_path = os.path.join(temp_dir, f'transition_{video_count + 1}.png')
+        render_transition_image(video_count + 1, size=size, is_final=True, color_scheme=color_scheme).save(card_path)
+        items.append({'type': 'image', 'path': card_path, 'duration': 1.0})
+
+        _report(progress, "ffmpeg渲染", 20)
+        render_timeline(items, output_path, chime_path="ding.wav", scale_mode=scale_mode, renditions=renditions)
+
+def parse_memory(value):
+    """解析内存大小（如 '512M'、'2G'、'1.5g'，不带单位时为字节数）"""
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGB]?)B?\s*', str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"无法解析内存大小: {value}")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).upper()])
+
+def chunk_size_for_memory(max_memory, size=(720, 1280)):
+    """根据内存上限计算每块包含的视频数：每个视频占用一个读取器、过渡画面和合成帧"""
+    frame_bytes = size[0] * size[1] * 3
+    per_video = CLIP_MEMORY + 2 * frame_bytes
+    return max(1, int((max_memory - BASE_MEMORY) // per_video))
+
+def load_trimmed_clip(video_file, info=None, scale_mode='stretch', trim=None):
+    """加载缩放后的视频并截取剪辑范围（默认去掉最后0.5秒），失败时不使用探测信息再试一次"""
+    try:
+        video = load_scaled_clip(video_file, info, scale_mode=scale_mode)
+        if video.duration <= 0:
+            raise Exception("视频长度无效")
+    except Exception as e:
+        logging.warning(f"视频加载出错，尝试备用方案: {str(e)}")
+        video = load_scaled_clip(video_file, scale_mode=scale_mode)
+    start, end = trim_range(video.duration, trim)
+    if (start, end) != (0, video.duration):
+        video = video.subclip(start, end)
+    return video
+
+def _merge_chunked(video_files, infos, output_path, title, author, color_scheme, chunk_size, scale_mode='stretch',
+                   progress=None, trims=None):
+    """分块合并：每次只打开 chunk_size 个视频，渲染为中间片段后关闭，最后无损拼接所有片段
+
+    所有片段用相同的参数编码，拼接时视频流复制；内存占用只取决于块大小，与视频总数无关。
+    """
+    from moviepy.video.compositing.concatenate import concatenate_videoclips
+    from moviepy_clips import MergeProgressLogger
+    video_count = len(video_files)
+    trims = trims or [None] * video_count
+    chunks = [list(range(start, min(start + chunk_size, video_count))) for start in range(0, video_count, chunk_size)]
+    logging.info(f"分块合并: {len(chunks)} 块，每块最多 {chunk_size} 个视频")
+    with tempfile.TemporaryDirectory(prefix='merge_') as temp_dir:
+        segments = []
+        for n, chunk in enumerate(chunks, 1):
+            _report(progress, f"渲染第 {n}/{len(chunks)} 块", 90 * (n - 1) / len(chunks))
+            clips = []
+            try:
+                for index in chunk:
+                    i = index + 1
+                    clips.append(create_number_transition(i, duration=1.0, size=(720, 1280), is_final=False,
+                                                          video_count=video_count, title_text=title,
+                                                          author_name=author if i == 1 else "",
+                                                          color_scheme=color_scheme))
+                    clips.append(load_trimmed_clip(video_files[index], infos[index] if infos else None, scale_mode,
+                                                   trims[index]))
+                if chunk[-1] == video_count - 1:
+                    clips.append(create_number_transition(video_count + 1, duration=1.0, size=(720, 1280),
+                                                          is_final=True, color_scheme=color_scheme))
+                # 所有片段都是 720x1280，直接首尾相接，不需要按最大尺寸合成画布
+                chunk_clip = concatenate_videoclips(clips, method="chain")
+                chunk_path = os.path.join(temp_dir, f'chunk_{n:04d}.mp4')
+                logger = 'bar'
+                if progress is not None:
+                    logger = MergeProgressLogger(progress, 90 * (n - 1) / len(chunks), 90 * n / len(chunks),
+                                                 stage=f"渲染第 {n}/{len(chunks)} 块")
+                chunk_clip.write_videofile(
+                    chunk_path,
+                    codec='libx264',
+                    audio_codec='aac',
+                    temp_audiofile=os.path.join(temp_dir, f'chunk_{n:04d}.m4a'),
+                    remove_temp=True,
+                    fps=30,
+                    threads=4,
+                    preset='medium',
+                    bitrate='4000k',
+                    audio_bitrate='192k',
+                    audio_fps=NORMALIZED_PARAMS['sample_rate'],
+                    logger=logger
+                )
+                chunk_clip.close()
+            finally:
+                for clip in clips:
+                    try:
+                        clip.close()
+                    except Exception:
+                        pass
+            segments.append({'path': chunk_path})
+            gc.collect()
+        _report(progress, "拼接片段", 90)
+        concat_segments(segments, output_path, normalize_audio=True)
+
+def _finish(output_path, renditions=None, progress=None, encoded=False):
+    """主输出完成后生成其他输出版本（encoded 为 True 时已在合并时一起编码），并记录输出文件"""
+    if renditions and not encoded:
+        _report(progress, "生成输出版本")
+        render_renditions(output_path, renditions)
+    logging.info("\n=== 处理完成 ===")
+    logging.info(f"输出文件: {output_path}")
+    for path, profile in renditions or []:
+        logging.info(f"输出版本 {profile['name']}: {path}")
+
+def skip_duplicates(video_files, trims):
+    """去掉内容重复的视频（同一个视频以不同文件名下载了多次），返回 (视频列表, 剪辑范围)"""
+    durations = [info['duration'] if info else None for info in probe_videos(video_files)]
+    keep, groups = drop_duplicates(video_files, durations)
+    for group in groups:
+        for i in group[1:]:
+            logging.info(f"跳过重复视频: {os.path.basename(video_files[i])}"
+                         f"（与 {os.path.basename(video_files[group[0]])} 相同）")
+    return [video_files[i] for i in keep], [trims[i] for i in keep]
+
+def merge_videos(input_dir=None, output_path=None, title="今日份快乐", author="", color_scheme='p6', fast_path=True, workers=None, use_cache=True,
+                 streaming=False, max_readers=2, incremental=True, segment_cache_dir=None, backend='auto',
+                 scale_mode='stretch', progress=None, max_memory=None, chunk_size=None, videos=None, pool=None,
+                 renditions=None, dedup=False):
+    """合并视频文件，添加过渡画面
+
+    videos 为按顺序排列的合并源列表，每项为文件路径或 {'path': 路径, 'start': 起点秒数, 'end': 终点秒数}；
+    指定时直接按列表顺序合并（不扫描 input_dir，也不复制文件），否则合并 input_dir 中的所有视频（按文件名排序）
+
+    backend 选择渲染方式：
+      'auto'    - 依次尝试流复制快速合并、并行转码，最后使用moviepy
+      'ffmpeg'  - 把整个时间线编译为一次ffmpeg调用（filter_complex），画面不经过Python
+      'moviepy' - 始终使用moviepy解码、合成和编码
+    fast_path 为 True 时先探测输入视频，参数一致则跳过重新编码直接拼接
+    workers 为并行转码的进程数，默认等于CPU核数；设为0时使用moviepy单进程编码
+    use_cache 为 True 时复用磁盘缓存中已编码的过渡片段
+    streaming 为 True 时使用moviepy合并（不走快速合并和并行转码），按需打开视频，同时最多保持 max_readers 个读取器
+    scale_mode 为缩放方式：'stretch' 拉伸到 720x1280，'fit' 保持比例加黑边，'blur' 保持比例并用模糊画面填充背景；
+    缩放都在解码器/ffmpeg中完成
+    incremental 为 True 时并行转码的片段保存在 segment_cache_dir（默认输出目录下的 .merge_cache），
+    再次合并时只转码新增或修改过的视频
+    progress 为进度回调 progress(阶段, 百分比)，回调中抛出的异常会中止合并
+    max_memory 为内存上限（如 '1G'）：moviepy合并改为分块渲染，块大小由上限计算（也可以用 chunk_size 直接指定），
+    并行转码的进程数也按上限减少
+    pool 为多个合并共享的进程池（ProcessPoolExecutor），并行转码时使用，此时 workers 应为进程池的大小
+    renditions 为其他输出版本的列表（预设名称如 '480p'、'preview'，或 {'name', 'size', 'bitrate'/'crf', 'preset'} 字典），
+    与主输出共用一次解码和合成，文件保存在主输出旁边（如 final-480p.mp4）
+    dedup 为 True 时先比较每个视频截取的几帧画面，内容重复的视频只保留最先出现的一个
+    """
     try:
+        if videos is not None:
+            video_files, trims = parse_sources(videos)
+            if not video_files:
+                logging.error("没有要合并的视频")
+                return False
+            missing = [f for f in video_files if not os.path.isfile(f)]
+            if missing:
+                logging.error(f"视频文件不存在: {', '.join(missing)}")
+                return False
+            if input_dir is None:
+                input_dir = os.path.dirname(video_files[0])
+
         # 设置默认值并转换为绝对路径
         if input_dir is None:
             input_dir = os.path.abspath("./11-23")
@@ -281,23 +1092,109 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
         # 创建输出目录（如果不存在）
         output_dir = os.path.dirname(output_path)
         os.makedirs(output_dir, exist_ok=True)
+        renditions = plan_renditions(output_path, renditions)
 
-        # 获取所有视频文件（使用完整路径）
-        video_files = []
-        for file in os.listdir(input_dir):
-            if file.endswith(('.mp4', '.MP4', '.mov', '.MOV')):
-                full_path = os.path.join(input_dir, file)
-                video_files.append(full_path)
+        if videos is None:
+            # 获取所有视频文件（使用完整路径），同时清理探测索引中已删除的文件
+            # 跳过上次合并生成的输出文件和其他输出版本
+            outputs = {output_path} | {path for path, _ in renditions}
+            video_files = [f for f in get_index(input_dir).list_videos() if f not in outputs]
 
-        if not video_files:
-            logging.error(f"未找到视频文件: {input_dir}")
-            return False
+            if not video_files:
+                logging.error(f"未找到视频文件: {input_dir}")
+                return False
 
-        video_files.sort()  # 按文件名排序
+            video_files.sort()  # 按文件名排序
+            trims = [None] * len(video_files)
+        if dedup:
+            video_files, trims = skip_duplicates(video_files, trims)
         video_count = len(video_files)
         logging.info(f"找到 {video_count} 个视频文件")
 
+        if backend not in MERGE_BACKENDS:
+            raise ValueError(f"未知的渲染方式: {backend}")
+        if backend == 'moviepy' or (streaming and backend == 'auto'):
+            # 流式合并是moviepy的读取方式，指定时直接使用moviepy合并
+            fast_path, workers = False, 0
+        elif streaming:
+            logging.warning("流式合并只对moviepy有效，ffmpeg渲染时忽略 streaming")
+        if scale_mode not in SCALE_MODES:
+            raise ValueError(f"未知的缩放方式: {scale_mode}")
+        if max_memory is not None:
+            memory = parse_memory(max_memory)
+            if chunk_size is None:
+                chunk_size = chunk_size_for_memory(memory)
+            if workers != 0:
+                workers = min(workers or os.cpu_count() or 1, max(1, (memory - BASE_MEMORY) // NORMALIZE_MEMORY))
+            logging.info(f"内存上限 {memory / 1024 ** 2:.0f}MB: 分块合并每块 {chunk_size} 个视频，最多 {workers or 1} 个转码进程")
+
+        _report(progress, "探测视频", 0)
+        # 视频参数从探测索引读取，只有新增或修改过的文件才会调用ffprobe
+        infos = probe_videos(video_files) if (fast_path or workers != 0 or backend == 'ffmpeg') else []
+        if infos and any(info is None for info in infos):
+            infos = [] if backend == 'ffmpeg' else infos
+        cache = None
+        if use_cache:
+            try:
+                cache = TransitionCache()
+            except OSError as e:
+                logging.warning(f"无法创建过渡画面缓存目录: {str(e)}")
+
+        if backend == 'ffmpeg':
+            logging.info("使用ffmpeg单次调用渲染")
+            _merge_ffmpeg(video_files, infos, output_path, title, author, color_scheme, scale_mode=scale_mode,
+                          progress=progress, trims=trims, renditions=renditions)
+            _finish(output_path, renditions, progress, encoded=True)
+            return
+
+        # 快速路径：所有视频参数一致时直接流复制拼接
+        if fast_path:
+            compatible, reason = check_stream_copy_compatible(infos)
+            if compatible:
+                logging.info("视频参数一致，使用流复制快速合并")
+                try:
+                    _merge_stream_copy(video_files, infos, output_path, title, author, color_scheme, cache=cache,
+                                       progress=progress, trims=trims)
+                except Exception as e:
+                    logging.warning(f"快速合并失败，改用重新编码: {str(e)}")
+                else:
+                    _finish(output_path, renditions, progress)
+                    return
+            else:
+                logging.info(f"无法使用快速合并: {reason}")
+
+        # 并行转码：每个视频单独转为统一规格，再拼接
+        if workers != 0:
+            if infos and all(info is not None for info in infos):
+                try:
+                    manifest = None
+                    if incremental:
+                        manifest = SegmentManifest(segment_cache_dir or os.path.join(output_dir, '.merge_cache'))
+                    _merge_normalized(video_files, infos, output_path, title, author, color_scheme,
+                                      workers=workers, cache=cache, manifest=manifest, scale_mode=scale_mode,
+                                      progress=progress, trims=trims, pool=pool)
+                except Exception as e:
+                    logging.warning(f"并行转码失败，改用moviepy合并: {str(e)}")
+                else:
+                    _finish(output_path, renditions, progress)
+                    return
+            else:
+                logging.info("无法探测视频参数（需要ffprobe），使用moviepy合并")
+
+        # 分块合并：内存占用只取决于块大小
+        if chunk_size:
+            _merge_chunked(video_files, infos, output_path, title, author, color_scheme, chunk_size,
+                           scale_mode=scale_mode, progress=progress, trims=trims)
+            _finish(output_path, renditions, progress)
+            return
+
+        from moviepy.video.compositing.concatenate import concatenate_videoclips
+        from moviepy_clips import MergeProgressLogger
+
         clips = []  # 存储所有片段
+        reader_pool = ReaderPool(max_readers) if streaming else None
+        if streaming:
+            logging.info(f"流式合并: 最多同时打开 {reader_pool.max_open} 个读取器")
         
         logging.info(f"\n=== 开始处理 ===")
         logging.info(f"- 视频数量: {video_count}")
@@ -310,6 +1207,7 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
             logging.info(f"处理视频 {i}/{video_count}")
             logging.info(f"文件: {os.path.basename(video_file)}")
             logging.info(f"==================================================")
+            _report(progress, f"加载视频 {i}/{video_count}", 20 * (i - 1) / video_count)
             
             try:
                 # 1. 创建过渡画面（普通的数字过渡）
@@ -326,24 +1224,18 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
                 logging.info(f"\n步骤 2/2: 加载视频")
                 # 添加错误处理和重试机制
                 try:
-                    video = VideoFileClip(video_file)
-                    # 强制调整视频尺寸为 720x1280
-                    video = video.resize((720, 1280))
-                    if video.duration > 0:  # 确保视频长度有效
-                        # 获取实际可用的持续时间
-                        actual_duration = video.duration
-                        # 如果视频末尾有问题，稍微缩短持续时间
-                        if actual_duration > 1:  # 确保视频长度超过1秒
-                            video = video.subclip(0, actual_duration - 0.5)  # 去掉最后0.5秒
+                    if reader_pool is not None:
+                        # 流式合并：只记录时长，播放到该片段时才打开读取器
+                        video = load_lazy_clip(video_file, infos[i - 1] if infos else None, reader_pool,
+                                               scale_mode=scale_mode, trim=trims[i - 1])
                     else:
-                        raise Exception("视频长度无效")
+                        # 解码器直接输出 720x1280（或保持比例的尺寸），截取剪辑范围（默认去掉最后0.5秒）
+                        video = load_trimmed_clip(video_file, infos[i - 1] if infos else None, scale_mode,
+                                                  trims[i - 1])
                 except Exception as e:
                     logging.warning(f"视频加载出错，尝试备用方案: {str(e)}")
-                    # 备用方案：使用ffmpeg-python直接加载
-                    video = VideoFileClip(video_file)
-                    video = video.resize((720, 1280))
-                    if video.duration > 1:
-                        video = video.subclip(0, video.duration - 0.5)
+                    # 备用方案：不使用探测信息直接加载
+                    video = load_trimmed_clip(video_file, scale_mode=scale_mode, trim=trims[i - 1])
                 
                 if video is None:
                     raise Exception("视频加载失败")
@@ -372,6 +1264,8 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
                         video.close()
                     except:
                         pass
+                if reader_pool is not None:
+                    reader_pool.close_all()
                 raise
         
         # 最终合并
@@ -391,6 +1285,10 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
             
             logging.info("  √ 片段合并成功")
             logging.info("\n写入最终文件...")
+            _report(progress, "写入文件", 30)
+            logger = MergeProgressLogger(progress) if progress is not None else 'bar'
+            # 临时音频放在输出文件旁边，多个合并任务同时运行时不会互相覆盖
+            temp_audiofile = os.path.splitext(output_path)[0] + '.temp-audio.m4a'
             
             # 写入文件
             try:
@@ -398,13 +1296,16 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
                     output_path,
                     codec='libx264',
                     audio_codec='aac',
-                    temp_audiofile='temp-audio_final.m4a',
+                    temp_audiofile=temp_audiofile,
                     remove_temp=True,
                     fps=30,
                     threads=4,
                     preset='medium',  # 使用medium预设，平衡速度和质量
                     bitrate='4000k',
-                    audio_bitrate='192k'
+                    audio_bitrate='192k',
+                    # 其他输出版本使用同一次合成的画面，在ffmpeg中分给各自的编码器
+                    ffmpeg_params=moviepy_fan_out_params(renditions, final.audio is not None) if renditions else None,
+                    logger=logger
                 )
                 logging.info("  √ 文件写入成功")
             except Exception as e:
@@ -415,7 +1316,9 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
                     fps=30,
                     threads=4,
                     preset='medium',
-                    bitrate='4000k'
+                    bitrate='4000k',
+                    ffmpeg_params=moviepy_fan_out_params(renditions, has_audio=False) if renditions else None,
+                    logger=logger
                 )
                 logging.info("  √ 无音频文件写入成功")
                 
@@ -436,18 +1339,15 @@ def merge_videos(input_dir=None, output_path=None, title="今日份快乐", auth
                     final.close()
             except:
                 pass
-            
-            # 删除过渡图片
-            for i in range(1, video_count + 2):
+            if reader_pool is not None:
+                reader_pool.close_all()
+            if 'temp_audiofile' in locals() and os.path.exists(temp_audiofile):
                 try:
-                    transition_file = f'transition_{i}.png'
-                    if os.path.exists(transition_file):
-                        os.remove(transition_file)
-                except:
+                    os.remove(temp_audiofile)
+                except OSError:
                     pass
                     
-        logging.info("\n=== 处理完成 ===")
-        logging.info(f"输出文件: {output_path}")
+        _finish(output_path, renditions, progress, encoded=True)
         
     except Exception as e:
         logging.error(f"\n发生错误: {str(e)}")
@@ -485,6 +1385,7 @@ def test_transition():
 
 if __name__ == "__main__":
     import argparse
+    import traceback
     
     parser = argparse.ArgumentParser(description='视频合并工具')
     parser.add_argument('--input_dir', '-i', type=str, help='输入视频文件夹路径')
@@ -493,9 +1394,26 @@ if __name__ == "__main__":
     parser.add_argument('--author', '-a', type=str, default="Cynvann", help='作者名称')
     parser.add_argument('--color_scheme', '-c', type=str, choices=['p1', 'p2', 'p3', 'p4', 'p5', 'p6'], 
                       default='p6', help='颜色方案选择：\n' + '\n'.join([f"{k}: {v['name']}" for k, v in COLOR_SCHEMES.items()]))
+    parser.add_argument('--no_fast_path', action='store_true', help='禁用流复制快速合并，总是重新编码')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='并行转码进程数（默认CPU核数，0表示使用moviepy单进程编码）')
+    parser.add_argument('--no_cache', action='store_true', help='不使用过渡画面缓存')
+    parser.add_argument('--streaming', action='store_true', help='使用moviepy合并并按需打开视频，降低内存占用')
+    parser.add_argument('--max_readers', type=int, default=2, help='流式合并时最多同时打开的读取器数量')
+    parser.add_argument('--no_incremental', action='store_true', help='不复用上次转码的片段，全部重新转码')
+    parser.add_argument('--backend', '-b', type=str, choices=MERGE_BACKENDS, default='auto',
+                      help='渲染方式：auto 自动选择，ffmpeg 单次ffmpeg调用渲染，moviepy 使用moviepy')
+    parser.add_argument('--scale_mode', '-s', type=str, choices=SCALE_MODES, default='stretch',
+                      help='缩放方式：stretch 拉伸，fit 保持比例加黑边，blur 保持比例并模糊背景')
+    parser.add_argument('--max_memory', type=str, default=None,
+                        help='内存上限（如 1G、512M），moviepy合并改为分块渲染，并限制并行转码进程数')
+    parser.add_argument('--chunk_size', type=int, default=None, help='分块合并时每块包含的视频数（覆盖按内存上限计算的值）')
+    parser.add_argument('--renditions', nargs='+', default=None,
+                        help='同时生成的其他输出版本：预设 480p、preview，或 名称=宽x高:码率或crf值:编码预设（如 540p=540x960:2000k:fast）')
+    parser.add_argument('--dedup', action='store_true', help='跳过内容重复的视频（同一个视频以不同文件名下载了多次）')
     parser.add_argument('--test', action='store_true', help='运行测试模式')
     
     args = parser.parse_args()
+    setup_logging()
     
     if args.test:
         test_transition()
@@ -542,7 +1460,19 @@ if __name__ == "__main__":
                 output_path=final_output,
                 title=args.title,
                 author=args.author,
-                color_scheme=args.color_scheme
+                color_scheme=args.color_scheme,
+                fast_path=not args.no_fast_path,
+                workers=args.workers,
+                use_cache=not args.no_cache,
+                streaming=args.streaming,
+                max_readers=args.max_readers,
+                incremental=not args.no_incremental,
+                backend=args.backend,
+                scale_mode=args.scale_mode,
+                max_memory=args.max_memory,
+                chunk_size=args.chunk_size,
+                renditions=args.renditions,
+                dedup=args.dedup
             )
             
             # 检查最终文件
@@ -1,13 +1,15 @@
 import os
-import tempfile
 import json
 from typing import Optional, List
-import gradio as gr
 from video_downloader import download_videos, extract_instagram_links
-from video_merger import merge_videos, COLOR_SCHEMES
+from video_merger import merge_videos, setup_logging, COLOR_SCHEMES, MERGE_BACKENDS, SegmentPrefetcher
+from probe_index import get_index
+from clip_dedup import find_duplicates
+from thumbnail_cache import get_thumbnail_cache
+from job_manager import get_job_manager
 
-def download_only(links: str, output_folder: str) -> str:
-    """仅下载视频"""
+def download_only(links: str, output_folder: str, progress=None, on_complete=None) -> str:
+    """仅下载视频，on_complete(链接, 文件列表) 在每个视频下载完成时调用"""
     try:
         # 确保输出文件夹存在
         os.makedirs(output_folder, exist_ok=True)
@@ -28,57 +30,121 @@ def download_only(links: str, output_folder: str) -> str:
             print(f"- {link}")
         
         # 下载视频
-        download_videos(links_list, output_folder)
+        failed = download_videos(links_list, output_folder, progress=progress, on_complete=on_complete)
+        if failed:
+            return (f"下载完成，{len(failed)} 个链接下载失败（详见 {os.path.join(output_folder, 'download_report.json')}）。"
+                    f"视频已保存到: {output_folder}")
         
         return f"下载完成！视频已保存到: {output_folder}"
     except Exception as e:
         return f"下载过程中出错: {str(e)}"
 
-def merge_only(input_folder: str, output_path: str, title: str, author: str) -> str:
+def merge_only(input_folder: str, output_path: str, title: str, author: str, backend: str = 'auto',
+               progress=None) -> str:
     """仅合并视频"""
     try:
-        merge_videos(input_folder, output_path, title, author)
+        merge_videos(input_folder, output_path, title, author, backend=backend, progress=progress)
         return f"合并完成！视频已保存到: {output_path}"
     except Exception as e:
         return f"合并过程中出错: {str(e)}"
 
-def download_and_merge(links: str, output_folder: str, output_path: str, title: str, author: str) -> str:
-    """下载并合并视频"""
+def scaled_progress(progress, start: float, end: float):
+    """把子步骤 0-100 的进度映射到整体进度的 start-end 区间"""
+    if progress is None:
+        return None
+    def report(stage, percent=None):
+        progress(stage, None if percent is None else start + (end - start) * percent / 100)
+    return report
+
+def download_and_merge(links: str, output_folder: str, output_path: str, title: str, author: str,
+                       progress=None) -> str:
+    """下载并合并视频
+
+    下载和转码流水线进行：每个视频下载完成后立即在后台进程中探测、缩放、裁剪并转码为中间片段，
+    网络传输和CPU转码同时进行；全部下载完成后等待剩余片段，合并时直接复用这些片段，只需拼接。
+    参数已符合流复制要求的视频不预转码，全部视频都符合时合并走快速路径直接拼接。
+    """
     try:
-        # 先下载
-        download_result = download_only(links, output_folder)
-        if "错误" in download_result:
-            return download_result
+        def submit_files(link, files):
+            for video_file in files:
+                prefetcher.submit(video_file)
+        
+        # 下载，同时转码已下载完成的视频
+        with SegmentPrefetcher(output_path) as prefetcher:
+            download_result = download_only(links, output_folder, progress=scaled_progress(progress, 0, 60),
+                                            on_complete=submit_files)
+            if "错误" in download_result:
+                return download_result
+            prefetcher.wait(progress=scaled_progress(progress, 60, 85))
         
         # 再合并
-        merge_result = merge_only(output_folder, output_path, title, author)
+        merge_result = merge_only(output_folder, output_path, title, author,
+                                  progress=scaled_progress(progress, 85, 100))
         return merge_result
     except Exception as e:
         return f"处理过程中出错: {str(e)}"
 
 def create_ui():
     """创建用户界面"""
-    
+    # gradio导入需要几秒，只在创建界面时导入，其他脚本导入本模块的下载、合并函数时不受影响
+    import gradio as gr
+
     def list_videos(folder_path: str) -> tuple:
         """列出文件夹中的视频文件并返回视频列表和预览组件"""
         if not os.path.exists(folder_path):
             return [], None, "文件夹不存在"
         
-        video_files = [f for f in os.listdir(folder_path) if f.endswith(('.mp4', '.MP4'))]
+        # 视频信息从探测索引读取，只有新增或修改过的文件才会调用ffprobe
+        index = get_index(folder_path)
+        video_files = index.list_videos(('.mp4', '.MP4'))
         if not video_files:
             return [], None, "文件夹中没有找到视频文件"
             
+        infos = index.probe_many(video_files)
+        durations = [info["duration"] if info else None for info in infos]
+        # 并行生成（或从缓存读取）封面图和预览片段，gallery不再加载完整视频
+        thumbnails = get_thumbnail_cache().build_many(video_files, durations)
+        # 比较每个视频截取的几帧画面，找出以不同文件名重复下载的视频
+        duplicate_of = {}
+        for group in find_duplicates(video_files, durations):
+            for i in group[1:]:
+                duplicate_of[i] = os.path.basename(video_files[group[0]])
+            
         # 构建视频列表的HTML
         videos_data = []
-        for idx, video in enumerate(video_files):
-            video_path = os.path.join(folder_path, video)
+        for i, (video_path, info, (poster, preview)) in enumerate(zip(video_files, infos, thumbnails)):
             videos_data.append({
                 "path": video_path,
-                "name": video,
-                "is_first": False
+                "name": os.path.basename(video_path),
+                "is_first": False,
+                "duration": info["duration"] if info else None,
+                "resolution": f"{info['width']}x{info['height']}" if info else None,
+                "poster": poster,
+                "preview": preview,
+                "duplicate_of": duplicate_of.get(i)
             })
             
-        return videos_data, os.path.join(folder_path, video_files[0]), "找到 {} 个视频文件".format(len(video_files))
+        status = "找到 {} 个视频文件".format(len(video_files))
+        if duplicate_of:
+            status += "，其中 {} 个与其他视频重复".format(len(duplicate_of))
+        return videos_data, video_files[0], status
+    
+    def video_label(video: dict) -> str:
+        """生成视频在列表中显示的名称"""
+        label = "[第一个] " if video["is_first"] else ""
+        if video.get("duplicate_of"):
+            label += "[重复] "
+        label += video["name"]
+        if video.get("duration"):
+            label += f" ({video['duration']:.1f}s"
+            if video.get("resolution"):
+                label += f" {video['resolution']}"
+            label += ")"
+        return label
+    
+    def gallery_item(video: dict) -> tuple:
+        """gallery中的一项：优先显示封面图"""
+        return (video.get("poster") or video["path"], video_label(video))
     
     def set_first_video(videos_data: List[dict], video_idx: int) -> List[dict]:
         """设置指定索引的视频为第一个"""
@@ -93,10 +159,17 @@ def create_ui():
         videos_data[video_idx]["is_first"] = True
         return videos_data
     
-    def get_final_video_order(videos_data: List[dict]) -> List[str]:
-        """根据is_first标记获取最终的视频顺序"""
+    def get_final_video_order(videos_data: List[dict], skip_duplicates: bool = False) -> List[str]:
+        """根据is_first标记获取最终的视频顺序，skip_duplicates 为 True 时每组重复的视频只保留一个
+
+        设为第一个的视频是重复视频时保留它，跳过与它相同的那个视频
+        """
         if not videos_data:
             return []
+        if skip_duplicates:
+            first_duplicate = next((v.get("duplicate_of") for v in videos_data if v["is_first"]), None)
+            videos_data = [v for v in videos_data
+                           if v["is_first"] or not (v.get("duplicate_of") or v["name"] == first_duplicate)]
             
         # 找到标记为第一个的视频
         first_video = next((v for v in videos_data if v["is_first"]), None)
@@ -108,6 +181,20 @@ def create_ui():
         else:
             return [v["path"] for v in videos_data]
     
+    def watch_job(job_id: Optional[str]):
+        """持续输出后台任务的状态，直到任务结束"""
+        job = get_job_manager().get(job_id) if job_id else None
+        if job is None:
+            yield "没有正在运行的任务"
+            return
+        yield from job.watch()
+    
+    def cancel_job(job_id: Optional[str]) -> str:
+        """取消后台任务"""
+        if job_id and get_job_manager().cancel(job_id):
+            return f"已请求取消任务 {job_id}"
+        return "没有可以取消的任务"
+    
     with gr.Blocks(title="Instagram视频批量下载器 欢迎关注视频号@Cynvann") as app:
         gr.Markdown("# 📱 Instagram视频批量下载器 欢迎关注视频号@Cynvann")
         
@@ -125,13 +212,33 @@ def create_ui():
                         placeholder="视频保存的文件夹路径",
                         value="downloads"
                     )
-                    download_btn = gr.Button("开始下载", variant="primary")
-                    download_output = gr.Textbox(label="下载结果")
+                    with gr.Row():
+                        download_btn = gr.Button("开始下载", variant="primary")
+                        cancel_download_btn = gr.Button("取消下载")
+                    download_output = gr.Textbox(label="下载结果", lines=5)
+                    download_job = gr.State(None)  # 当前下载任务的ID
+                    
+                    def submit_download(links, folder):
+                        """把下载提交到后台任务队列"""
+                        return get_job_manager().submit('download', download_only, links, folder).id
                     
+                    # 提交任务后立即返回，进度通过生成器持续推送，不占用界面的处理线程
                     download_btn.click(
-                        fn=download_only,
+                        fn=submit_download,
                         inputs=[links_input, download_output_folder],
-                        outputs=download_output
+                        outputs=download_job,
+                        concurrency_limit=None
+                    ).then(
+                        fn=watch_job,
+                        inputs=download_job,
+                        outputs=download_output,
+                        concurrency_limit=None
+                    )
+                    cancel_download_btn.click(
+                        fn=cancel_job,
+                        inputs=download_job,
+                        outputs=download_output,
+                        concurrency_limit=None
                     )
             
             # 合并标签页
@@ -158,6 +265,7 @@ def create_ui():
                         elem_id="video-gallery"
                     )
                     selected_video = gr.State(None)  # 存储当前选中的视频
+                    video_preview = gr.Video(label="预览", height=300, interactive=False)
                     set_first_btn = gr.Button("设为第一个视频", variant="primary")
                     
                     def update_video_list(folder):
@@ -168,9 +276,7 @@ def create_ui():
                         # 为每个视频创建预览信息
                         gallery_data = []
                         for video in videos_data:
-                            label = "[第一个] " if video["is_first"] else ""
-                            label += video["name"]
-                            gallery_data.append((video["path"], label))
+                            gallery_data.append(gallery_item(video))
                             
                         return videos_data, gallery_data, None, status
                     
@@ -183,21 +289,18 @@ def create_ui():
                     def handle_set_first(videos_data: List[dict], selected_name: str):
                         """设置选中的视频为第一个"""
                         if not videos_data or selected_name is None:
-                            gallery_data = [(v["path"], f"{'[第一个] ' if v['is_first'] else ''}{v['name']}") 
-                                          for v in videos_data]
+                            gallery_data = [gallery_item(v) for v in videos_data]
                             return videos_data, gallery_data, None
                             
                         # 根据名称找到索引
                         selected_idx = next((i for i, v in enumerate(videos_data) if v['name'] == selected_name), None)
                         if selected_idx is None:
-                            gallery_data = [(v["path"], f"{'[第一个] ' if v['is_first'] else ''}{v['name']}") 
-                                          for v in videos_data]
+                            gallery_data = [gallery_item(v) for v in videos_data]
                             return videos_data, gallery_data, None
                             
                         # 更新视频顺序
                         updated_videos = set_first_video(videos_data, selected_idx)
-                        gallery_data = [(v["path"], f"{'[第一个] ' if v['is_first'] else ''}{v['name']}") 
-                                      for v in updated_videos]
+                        gallery_data = [gallery_item(v) for v in updated_videos]
                         return updated_videos, gallery_data, None
                     
                     def update_preview(videos_data: List[dict], selected_name: str):
@@ -206,13 +309,17 @@ def create_ui():
                             return None
                         # 根据名称找到对应的视频
                         video = next((v for v in videos_data if v['name'] == selected_name), None)
-                        return video['path'] if video else None
+                        if not video:
+                            return None
+                        return video.get('preview') or video['path']
                     
-                    def handle_merge(videos_data: List[dict], output_path: str, title: str, author: str, color_scheme: str):
+                    def handle_merge(videos_data: List[dict], output_path: str, title: str, author: str, color_scheme: str,
+                                     backend: str = 'auto', scale_mode: str = 'stretch', skip_duplicates: bool = True,
+                                     progress=None):
                         if not videos_data:
                             return "没有找到要合并的视频"
                         
-                        video_paths = get_final_video_order(videos_data)
+                        video_paths = get_final_video_order(videos_data, skip_duplicates)
                         
                         try:
                             # 确保输出路径是绝对路径
@@ -225,28 +332,15 @@ def create_ui():
                             output_dir = os.path.dirname(output_path)
                             os.makedirs(output_dir, exist_ok=True)
                             
-                            # 将所有视频文件复制到临时目录，按照指定顺序重命名
-                            with tempfile.TemporaryDirectory() as temp_dir:
-                                # 按顺序复制并重命名视频文件
-                                for idx, video_path in enumerate(video_paths):
-                                    new_name = f"{idx+1:03d}_{os.path.basename(video_path)}"
-                                    new_path = os.path.join(temp_dir, new_name)
-                                    try:
-                                        os.link(video_path, new_path)
-                                    except OSError:
-                                        import shutil
-                                        shutil.copy2(video_path, new_path)
-                                
-                                # 使用临时目录进行合并，确保使用绝对路径
-                                merge_videos(temp_dir, output_path, title, author, color_scheme)
-                                
-                                if not os.path.exists(output_path):
-                                    return f"合并失败：未找到输出文件 {output_path}"
-                                
-                                import time
-                                time.sleep(1)
+                            # 直接按界面中的顺序合并，不复制或链接文件
+                            merge_videos(output_path=output_path, title=title, author=author,
+                                         color_scheme=color_scheme, backend=backend, scale_mode=scale_mode,
+                                         progress=progress, videos=video_paths)
+                            
+                            if not os.path.exists(output_path):
+                                return f"合并失败：未找到输出文件 {output_path}"
                             
-                            if not os.path.exists(output_path) or os.path.getsize(output_path) == 0:
+                            if os.path.getsize(output_path) == 0:
                                 return f"合并失败：输出文件无效 {output_path}"
                             
                             return f"合并完成！视频已保存到: {output_path}"
@@ -264,6 +358,10 @@ def create_ui():
                         fn=handle_gallery_select,
                         inputs=[videos_state],
                         outputs=[selected_video]
+                    ).then(
+                        fn=update_preview,
+                        inputs=[videos_state, selected_video],
+                        outputs=[video_preview]
                     )
                     
                     set_first_btn.click(
@@ -303,25 +401,74 @@ def create_ui():
                         type="value"
                     )
                     
-                    merge_btn = gr.Button("开始合并", variant="primary")
-                    merge_output = gr.Textbox(label="合并结果")
+                    # 渲染方式选择
+                    backend = gr.Radio(
+                        label="渲染方式",
+                        choices=[
+                            ("自动（优先快速合并/并行转码）", "auto"),
+                            ("ffmpeg 单次渲染", "ffmpeg"),
+                            ("moviepy", "moviepy")
+                        ],
+                        value="auto"
+                    )
+                    
+                    # 缩放方式选择
+                    scale_mode = gr.Radio(
+                        label="缩放方式",
+                        choices=[
+                            ("拉伸填满", "stretch"),
+                            ("保持比例加黑边", "fit"),
+                            ("保持比例模糊背景", "blur")
+                        ],
+                        value="stretch"
+                    )
+                    
+                    skip_duplicates = gr.Checkbox(label="跳过重复的视频（列表中标记为[重复]）", value=True)
+                    
+                    with gr.Row():
+                        merge_btn = gr.Button("开始合并", variant="primary")
+                        cancel_merge_btn = gr.Button("取消合并")
+                    merge_output = gr.Textbox(label="合并结果", lines=5)
+                    merge_job = gr.State(None)  # 当前合并任务的ID
                     
                     # 处理颜色方案选择值
                     def process_merge(*args):
-                        videos_data, output_path, title, author, color_scheme = args
+                        videos_data, output_path, title, author, color_scheme, backend, scale_mode, skip_duplicates = args
                         # 从选择值中提取颜色方案代码
                         scheme_code = color_scheme.split(" - ")[0]
-                        return handle_merge(videos_data, output_path, title, author, scheme_code)
+                        if backend not in MERGE_BACKENDS:
+                            backend = 'auto'
+                        # 提交到后台任务队列，同一个输出文件的合并任务依次执行
+                        resource = output_path
+                        if videos_data and not os.path.isabs(output_path):
+                            resource = os.path.join(os.path.dirname(videos_data[0]["path"]), output_path)
+                        return get_job_manager().submit('merge', handle_merge, videos_data, output_path, title, author,
+                                                        scheme_code, backend, scale_mode, skip_duplicates,
+                                                        resource=os.path.abspath(resource)).id
                     
                     merge_btn.click(
                         fn=process_merge,
-                        inputs=[videos_state, output_path, title, author, color_scheme],
-                        outputs=[merge_output]
+                        inputs=[videos_state, output_path, title, author, color_scheme, backend, scale_mode,
+                                skip_duplicates],
+                        outputs=[merge_job],
+                        concurrency_limit=None
+                    ).then(
+                        fn=watch_job,
+                        inputs=merge_job,
+                        outputs=merge_output,
+                        concurrency_limit=None
+                    )
+                    cancel_merge_btn.click(
+                        fn=cancel_job,
+                        inputs=merge_job,
+                        outputs=merge_output,
+                        concurrency_limit=None
                     )
 
     return app
 
 if __name__ == "__main__":
+    setup_logging()
     app = create_ui()
     app.launch(
         server_name="127.0.0.1",  # 本地服务器地址
@@ -332,5 +479,7 @@ if __name__ == "__main__":
         auth=None,                # 不设置访问密码
         favicon_path=None,        # 默认网站图标
         quiet=True,               # 减少命令行输出
+        # 封面图和预览片段缓存在用户目录下，gradio默认只允许访问当前目录和临时目录
+        allowed_paths=[get_thumbnail_cache().cache_dir],
         # enable_queue=True,        # 启用队列处理请求
     )